@@ -0,0 +1,98 @@
+"""
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+Keeps the Jersey City parcels used as the grey background of the
+maps as one dissolved and simplified shape. The parcels are only
+read, dissolved and simplified when the cache is missing, when the
+parcels file changed or when the figure needs a finer shape, and
+the result is saved as GeoParquet.
+"""
+import os
+import sys
+import json
+
+import geopandas as gpd
+
+import render
+
+PARCELS_PATH = sys.path[0] + '/jersey-city-parcels.geojson'
+BASEMAP_PATH = sys.path[0] + '/parcels_basemap.parquet'
+
+
+def source_key(source, tolerance):
+    """
+    Returns what the cache depends on: the size and modification
+    time of the parcels file and the simplification tolerance.
+
+    @param source    | path of the parcels file.
+    @param tolerance | simplification tolerance.
+    """
+    stat = os.stat(source)
+    return {'source': os.path.abspath(source), 'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns, 'tolerance': tolerance}
+
+
+def pixel_tolerance(bounds, width, dpi):
+    """
+    Returns the width of one pixel of a map of the bounds drawn
+    width inches wide at the dpi, in the units of the bounds.
+    Simplifying to it leaves the drawn map unchanged.
+
+    @param bounds | (minx, miny, maxx, maxy) of the map.
+    @param width  | width of the figure in inches.
+    @param dpi    | resolution of the figure.
+    """
+    return float(bounds[2] - bounds[0]) / (width * dpi)
+
+
+def build_basemap(parcels, tolerance):
+    """
+    Returns the parcels dissolved into one shape and simplified to
+    the tolerance, as a geodataframe of one row.
+
+    @param parcels   | the parcel geodataframe.
+    @param tolerance | simplification tolerance, in the units of the
+                       parcels.
+    """
+    shape = parcels.geometry.make_valid().union_all()
+    return gpd.GeoDataFrame(
+        geometry=[shape.simplify(tolerance)], crs=parcels.crs)
+
+
+def load_basemap(source=None, cache=None, width=20, dpi=render.DPI):
+    """
+    Returns the basemap of the parcels for a map width inches wide
+    at the dpi, from the cache when it is still valid, and builds
+    and caches it otherwise.
+
+    @param source | path of the parcels file, defaults to
+                    PARCELS_PATH.
+    @param cache  | path of the cache, defaults to BASEMAP_PATH.
+    @param width  | width of the figure in inches.
+    @param dpi    | resolution of the figure.
+    """
+    source = source or PARCELS_PATH
+    cache = cache or BASEMAP_PATH
+    key_path = cache + '.json'
+    if os.path.exists(cache) and os.path.exists(key_path):
+        with open(key_path) as f:
+            key = json.load(f)
+        if key == source_key(source, key['tolerance']):
+            basemap = gpd.read_parquet(cache)
+            # the bounds of the basemap are the bounds of the parcels
+            if key['tolerance'] <= pixel_tolerance(
+                    basemap.total_bounds, width, dpi):
+                return basemap
+
+    print('Building basemap of ' + source + ': Started')
+    parcels = gpd.read_file(source)
+    tolerance = pixel_tolerance(parcels.total_bounds, width, dpi)
+    basemap = build_basemap(parcels, tolerance)
+    basemap.to_parquet(cache)
+    with open(key_path, 'w') as f:
+        json.dump(source_key(source, tolerance), f)
+    print('Building basemap of ' + source + ': Complete')
+    return basemap
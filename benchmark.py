@@ -0,0 +1,363 @@
+"""
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+Benchmarks the ingest -> clean -> analyze pipeline on synthetic
+Citi Bike trips, recording the wall time and the memory every stage adds at its
+peak, and comparing them against a saved baseline.
+
+    python benchmark.py --rows 100000 1000000 --save-baseline
+    python benchmark.py --rows 100000 1000000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import matplotlib
+
+matplotlib.use('Agg')
+
+import cube  # noqa: E402
+import dataset  # noqa: E402
+import trip_store  # noqa: E402
+import get_data  # noqa: E402
+import instrument  # noqa: E402
+import question1_final  # noqa: E402
+import ml_model  # noqa: E402
+import plot  # noqa: E402
+import render  # noqa: E402
+import stations  # noqa: E402
+
+BASELINE = sys.path[0] + '/benchmark_baseline.json'
+TRANSIT = sys.path[0] + '/jersey-city-public-transit.geojson'
+SIZES = [100000, 1000000, 10000000]
+# Increases smaller than these are noise, whatever the percentage
+NOISE = {'seconds': 0.5, 'stage_rss_mb': 10}
+
+# Column names of the csv files before and after 2017
+OLD_COLUMNS = {
+    'tripduration': 'Trip Duration', 'starttime': 'Start Time',
+    'stoptime': 'Stop Time', 'startstationid': 'Start Station ID',
+    'startstationname': 'Start Station Name',
+    'startstationlatitude': 'Start Station Latitude',
+    'startstationlongitude': 'Start Station Longitude',
+    'endstationid': 'End Station ID', 'endstationname': 'End Station Name',
+    'endstationlatitude': 'End Station Latitude',
+    'endstationlongitude': 'End Station Longitude', 'bikeid': 'Bike ID',
+    'usertype': 'User Type', 'birthyear': 'Birth Year', 'gender': 'Gender'}
+
+
+def generate_trips(rows, station_count=50, years=(2015, 2019), seed=1,
+                   month=None):
+    """
+    Returns a dataframe of synthetic Citi Bike trips with the same
+    columns as the combined csv files. The stations lie around
+    Jersey City, and about 5% of the trips end at one of a few New
+    York stations so that cleaning has something to remove.
+
+    @param rows          | number of trips.
+    @param station_count | number of Jersey City stations.
+    @param years         | first and last year of the trips.
+    @param seed          | seed of the random generator.
+    @param month         | 'YYYYMM' of the only month of the trips,
+                           instead of the years.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(3183, 3183 + station_count)
+    names = np.array(['JC Station %d' % i for i in ids])
+    lat = 40.72 + rng.uniform(-0.03, 0.03, station_count)
+    lon = -74.05 + rng.uniform(-0.03, 0.03, station_count)
+
+    nyc = 5
+    end_ids = np.concatenate([ids, np.arange(500, 500 + nyc)])
+    end_names = np.concatenate(
+        [names, ['NYC Station %d' % i for i in range(nyc)]])
+    end_lat = np.concatenate([lat, 40.75 + rng.uniform(-0.01, 0.01, nyc)])
+    end_lon = np.concatenate([lon, -73.99 + rng.uniform(-0.01, 0.01, nyc)])
+
+    start = rng.integers(0, station_count, rows)
+    end = np.where(rng.random(rows) < 0.05,
+                   rng.integers(station_count, station_count + nyc, rows),
+                   rng.integers(0, station_count, rows))
+    first = pd.Timestamp(years[0], 1, 1)
+    last = pd.Timestamp(years[1] + 1, 1, 1)
+    if month is not None:
+        first = pd.Timestamp(int(month[:4]), int(month[4:]), 1)
+        last = first + pd.offsets.MonthBegin()
+    seconds = (last - first).total_seconds()
+    starttime = first + pd.to_timedelta(
+        np.sort(rng.integers(0, seconds, rows)), unit='s')
+    duration = rng.lognormal(6, 0.8, rows).astype('int64') + 60
+    birthyear = rng.integers(1940, 2002, rows).astype('float64')
+    birthyear[rng.random(rows) < 0.02] = np.nan
+
+    return pd.DataFrame({
+        'tripduration': duration,
+        'starttime': starttime,
+        'stoptime': starttime + pd.to_timedelta(duration, unit='s'),
+        'startstationid': ids[start],
+        'startstationname': names[start],
+        'startstationlatitude': lat[start],
+        'startstationlongitude': lon[start],
+        'endstationid': end_ids[end],
+        'endstationname': end_names[end],
+        'endstationlatitude': end_lat[end],
+        'endstationlongitude': end_lon[end],
+        'bikeid': rng.integers(24000, 30000, rows),
+        'usertype': np.where(rng.random(rows) < 0.9, 'Subscriber',
+                             'Customer'),
+        'birthyear': birthyear,
+        'gender': rng.integers(0, 3, rows)})
+
+
+def write_month_csvs(trips, csv_file_path):
+    """
+    Saves the trips as one csv file per month, like the extracted
+    Citi Bike files, with the old column names before 2017.
+
+    @param trips         | the synthetic trips.
+    @param csv_file_path | the directory of the csv files.
+    """
+    months = trips['starttime'].dt.to_period('M')
+    for month, df in trips.groupby(months):
+        if month.year < 2017:
+            df = df.rename(columns=OLD_COLUMNS)
+        df.to_csv(os.path.join(csv_file_path, 'JC-%d%02d-citibike-tripdata'
+                               '.csv' % (month.year, month.month)),
+                  index=None, header=True, date_format='%Y-%m-%d %H:%M:%S')
+
+
+def spatial_stage(df_trip, gdf_transit, station_table):
+    """
+    Runs the spatial analysis of question1_final without the plots.
+
+    @param df_trip       | the cleaned trips.
+    @param gdf_transit   | the transit stations.
+    @param station_table | the station table.
+    """
+    bike_stations = question1_final.get_bike_stations(
+        df_trip, station_table)
+    filtered_gdf_transit = question1_final.filter_transit(gdf_transit)
+    bike_transit = question1_final.bike_transit_pairs(
+        bike_stations, filtered_gdf_transit)
+    bike_within_transit = question1_final.filter_bike_stations(
+        bike_stations, bike_transit)
+    bike_trip_conclusion = question1_final.distribute_trips(bike_transit)
+    other_row = question1_final.bike_outside_transit(
+        bike_stations, bike_within_transit)
+    return question1_final.conclude_data(bike_trip_conclusion, other_row)
+
+
+# Every stage gets the dict of prepared inputs
+STAGES = {
+    'combine': lambda data: get_data.get_combined_csv_files(data['csv']),
+    'clean': lambda data: get_data.data_cleaning(data['raw']),
+    'bike_stations': lambda data: question1_final.get_bike_stations(
+        data['clean'][question1_final.STATION_COLUMNS].copy(),
+        data['stations']),
+    'spatial': lambda data: spatial_stage(
+        data['clean'][question1_final.STATION_COLUMNS].copy(),
+        data['transit'], data['stations']),
+    'decision_tree': lambda data: ml_model.decision_tree_classifier(
+        ml_model.filter_data(data['clean'])),
+    'mlp': lambda data: ml_model.mlp_classifier(
+        ml_model.filter_data(data['clean'])),
+    'cube': lambda data: cube.build_cube(data['clean']),
+    'plot': lambda data: render.render_all(plot.plot_jobs(
+        cube.build_cube(data['clean']))),
+}
+# The MLP takes hours at 1e7 rows, so it only runs when asked for
+DEFAULT_STAGES = [stage for stage in STAGES if stage != 'mlp']
+
+
+def run_stage(stage, data, conn):
+    """
+    Runs the stage in a child process and sends back its wall time,
+    the resident memory of the child when it started and how much
+    the stage added to it at its peak, in MB, or the error it
+    raised. The output of the stage is discarded.
+
+    @param stage | name of the stage.
+    @param data  | the prepared inputs.
+    @param conn  | the pipe back to the parent process.
+    """
+    # The forked child starts with the memory of the parent: the
+    # imports and the prepared inputs
+    start_rss = instrument.current_rss() / 2 ** 20
+    try:
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            STAGES[stage](data)
+            seconds = time.perf_counter() - start
+    except Exception as error:
+        conn.send({'error': repr(error)})
+    else:
+        # ru_maxrss is in KB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        conn.send({'seconds': seconds, 'start_rss_mb': start_rss,
+                   'stage_rss_mb': max(peak - start_rss, 0)})
+    conn.close()
+
+
+def measure(stage, data):
+    """
+    Returns the wall time and memory of the stage. Each stage runs
+    in a forked process, so that its peak memory is not hidden by
+    the peak of an earlier stage.
+
+    @param stage | name of the stage.
+    @param data  | the prepared inputs.
+    """
+    context = multiprocessing.get_context('fork')
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=run_stage, args=(stage, data, child))
+    process.start()
+    child.close()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def prepare(rows, station_count, workdir):
+    """
+    Returns the inputs of all the stages for the number of rows:
+    the month csv files, the combined raw trips, the cleaned trips,
+    the station table and the transit stations.
+
+    @param rows          | number of trips.
+    @param station_count | number of Jersey City stations.
+    @param workdir       | temporary directory of the run.
+    """
+    trips = generate_trips(rows, station_count)
+    csv_file_path = os.path.join(workdir, 'JCfiles')
+    os.makedirs(csv_file_path)
+    write_month_csvs(trips, csv_file_path)
+
+    raw = trip_store.apply_schema(trips)
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        clean = get_data.data_cleaning(raw.copy())
+    return {'csv': csv_file_path, 'raw': raw, 'clean': clean,
+            'stations': stations.build_table(stations.observe_stations(raw)),
+            'transit': gpd.read_file(TRANSIT)}
+
+
+def run(sizes, stages, station_count=50):
+    """
+    Runs the stages at every size and returns a dict from
+    'stage@rows' to the measured wall time and memory.
+    Outputs of the pipeline (stores, figures) go to a temporary
+    directory.
+
+    @param sizes         | list of numbers of trips.
+    @param stages        | list of names of the stages.
+    @param station_count | number of Jersey City stations.
+    """
+    results = {}
+    cwd = os.getcwd()
+    stores = (trip_store.RAW_STORE, trip_store.CLEAN_STORE,
+              stations.STATION_STORE, dataset.CACHE_DIR)
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        trip_store.RAW_STORE = os.path.join(workdir, 'bike_data.parquet')
+        trip_store.CLEAN_STORE = os.path.join(workdir,
+                                              'filtered_bike_data.parquet')
+        stations.STATION_STORE = os.path.join(workdir, 'stations.parquet')
+        dataset.CACHE_DIR = os.path.join(workdir, 'split_cache')
+        try:
+            for rows in sizes:
+                run_dir = os.path.join(workdir, str(rows))
+                os.makedirs(run_dir)
+                print('Preparing %d rows' % rows)
+                data = prepare(rows, station_count, run_dir)
+                for stage in stages:
+                    result = measure(stage, data)
+                    results['%s@%d' % (stage, rows)] = result
+                    if 'error' in result:
+                        print('  %-14s failed: %s' % (stage, result['error']))
+                    else:
+                        print('  %-14s %10.2fs %10.1f MB (from %.1f MB)' % (
+                            stage, result['seconds'], result['stage_rss_mb'],
+                            result['start_rss_mb']))
+        finally:
+            os.chdir(cwd)
+            (trip_store.RAW_STORE, trip_store.CLEAN_STORE,
+             stations.STATION_STORE, dataset.CACHE_DIR) = stores
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Returns the list of regressions: the stages that took more time
+    or memory than the baseline by more than the tolerance (and by
+    more than the noise).
+
+    @param results   | the measured results.
+    @param baseline  | the baseline results.
+    @param tolerance | allowed relative increase, 0.2 is 20%.
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        if key not in baseline or 'error' in result or \
+                'error' in baseline[key]:
+            continue
+        for metric in ['seconds', 'stage_rss_mb']:
+            if metric not in baseline[key]:
+                continue
+            before = baseline[key][metric]
+            after = result[metric]
+            if after > before * (1 + tolerance) and \
+                    after - before > NOISE[metric]:
+                regressions.append('%s %s: %.2f -> %.2f (+%.0f%%)' % (
+                    key, metric, before, after,
+                    100 * (after / before - 1)))
+    return regressions
+
+
+def main():
+    """
+    Runs the benchmark and compares it with the baseline, or
+    saves it as the new baseline.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--stages', nargs='+', default=DEFAULT_STAGES,
+                        choices=list(STAGES))
+    parser.add_argument('--stations', type=int, default=50)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    results = run(args.rows, args.stages, args.stations)
+
+    if args.save_baseline:
+        baseline = get_data.read_json(args.baseline)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print('Saved baseline to ' + args.baseline)
+        return
+
+    regressions = compare(results, get_data.read_json(args.baseline),
+                          args.tolerance)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    if len(regressions) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
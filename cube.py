@@ -0,0 +1,140 @@
+"""
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+Keeps an aggregate of the cleaned trips: the trip count and the
+sum and sum of squares of the trip duration for every year, month,
+season, period, peak, gender, user type and age band. It is built
+while cleaning and saved inside the cleaned trip store, so that the
+plots read a few thousand rows instead of every trip.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import trip_store
+
+CUBE_NAME = '_cube.parquet'
+CUBE_KEYS = ['year', 'month', 'Season', 'Period', 'Peak', 'gender',
+             'usertype', 'age_band']
+# Columns of the trips needed to build the cube
+TRIP_COLUMNS = ['year', 'month', 'Season', 'Period', 'Peak', 'gender',
+                'usertype', 'age', 'tripduration']
+
+# Age bands of the riders. The outer bands are open, so that
+# every cleaned trip is counted in the cube.
+AGE_EDGES = [-np.inf, 25, 35, 45, 55, 65, np.inf]
+AGE_BANDS = ['<25', '25-34', '35-44', '45-54', '55-64', '65+']
+
+
+def cube_path(store_path=None):
+    """
+    Returns the path of the cube of the cleaned trip store.
+
+    @param store_path | the directory of the cleaned trip store,
+                        defaults to trip_store.CLEAN_STORE.
+    """
+    return os.path.join(store_path or trip_store.CLEAN_STORE, CUBE_NAME)
+
+
+def build_cube(trips):
+    """
+    Returns the cube of the cleaned trips, one row per combination
+    of CUBE_KEYS that has trips.
+
+    @param trips | the cleaned trip dataframe.
+    """
+    duration = trips['tripduration'].to_numpy(dtype='float64')
+    df = pd.DataFrame({key: trips[key] for key in CUBE_KEYS[:-1]})
+    df['age_band'] = pd.cut(trips['age'], AGE_EDGES, labels=AGE_BANDS,
+                            right=False)
+    df['count'] = 1
+    df['duration_sum'] = duration
+    df['duration_sumsq'] = duration ** 2
+    return df.groupby(CUBE_KEYS, observed=True, sort=False).sum()\
+        .reset_index()
+
+
+def merge_cubes(cubes):
+    """
+    Returns the cubes added up into one.
+
+    @param cubes | list of cubes.
+    """
+    cubes = [cube for cube in cubes if len(cube) > 0]
+    if len(cubes) == 0:
+        return build_cube(pd.DataFrame({column: [] for column in
+                                        TRIP_COLUMNS}))
+    return trip_store.concat_trips(cubes).groupby(
+        CUBE_KEYS, observed=True, sort=False).sum().reset_index()
+
+
+def write_cube(cube, store_path=None):
+    """
+    Saves the cube inside the cleaned trip store.
+
+    @param cube       | the cube.
+    @param store_path | the directory of the cleaned trip store,
+                        defaults to trip_store.CLEAN_STORE.
+    """
+    os.makedirs(store_path or trip_store.CLEAN_STORE, exist_ok=True)
+    cube.to_parquet(cube_path(store_path), index=False)
+
+
+def read_cube(store_path=None):
+    """
+    Returns the cube of the cleaned trip store. If it was never
+    built, it is built from the trips and saved first.
+
+    @param store_path | the directory of the cleaned trip store,
+                        defaults to trip_store.CLEAN_STORE.
+    """
+    path = cube_path(store_path)
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    cube = build_cube(trip_store.load_trips(
+        TRIP_COLUMNS, store_path=store_path or trip_store.CLEAN_STORE))
+    if os.path.exists(store_path or trip_store.CLEAN_STORE):
+        write_cube(cube, store_path)
+    return cube
+
+
+def replace_months(cube, months, store_path=None):
+    """
+    Replaces the rows of the given months of the saved cube by the
+    cube of their cleaned trips, and returns the updated cube.
+
+    @param cube       | the cube of the trips of the months.
+    @param months     | list of (year, month) pairs that were
+                        cleaned again.
+    @param store_path | the directory of the cleaned trip store,
+                        defaults to trip_store.CLEAN_STORE.
+    """
+    old = read_cube(store_path)
+    replaced = pd.MultiIndex.from_frame(old[['year', 'month']]).isin(
+        list(months))
+    cube = merge_cubes([old.loc[~replaced], cube])
+    write_cube(cube, store_path)
+    return cube
+
+
+def rollup(cube, keys):
+    """
+    Returns the trip count and the mean and standard deviation of
+    the trip duration for every combination of the keys.
+
+    @param cube | the cube.
+    @param keys | list of columns of CUBE_KEYS.
+    """
+    df = cube.groupby(keys, observed=True)[
+        ['count', 'duration_sum', 'duration_sumsq']].sum()
+    count = df['count'].to_numpy(dtype='float64')
+    mean = df['duration_sum'] / count
+    variance = (df['duration_sumsq'] - df['duration_sum'] * mean) / \
+        np.maximum(count - 1, 1)
+    return pd.DataFrame({'count': df['count'], 'tripduration': mean,
+                         'tripduration_std': np.sqrt(variance.clip(0))})\
+        .reset_index()
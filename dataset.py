@@ -0,0 +1,148 @@
+"""
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+Prepares the train and test sets of the machine learning models
+once: the features are encoded with the features class and split
+with a fixed seed, and the matrices are saved as numpy arrays in a
+directory named after a hash of the data, its columns, the seed and
+the test size. Every model then loads the same split memory-mapped
+instead of encoding and splitting the trips again.
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.model_selection import train_test_split
+
+import features
+import instrument
+
+CACHE_DIR = sys.path[0] + '/split_cache'
+SEED = 1
+TEST_SIZE = 0.2
+TARGET = 'endstationname'
+# Bump when the encoding changes, so that old splits are not reused
+SPLIT_VERSION = 1
+
+
+def split_key(filtered_data, seed=SEED, test_size=TEST_SIZE):
+    """
+    Returns the hash of the data, its columns, the seed and the
+    test size that names the cached split.
+
+    @param filtered_data | filtered Citi Bike trip data.
+    @param seed          | random state of the split.
+    @param test_size     | share of the trips in the test set.
+    """
+    digest = hashlib.sha256(json.dumps(
+        [SPLIT_VERSION, list(filtered_data.columns), seed, test_size],
+        default=str).encode())
+    digest.update(pd.util.hash_pandas_object(
+        filtered_data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def build_split(filtered_data, seed=SEED, test_size=TEST_SIZE):
+    """
+    Returns the split of the trips: the encoded train and test
+    features, the class codes of their end stations, the class
+    names and the vocabulary of the features.
+
+    @param filtered_data | filtered Citi Bike trip data.
+    @param seed          | random state of the split.
+    @param test_size     | share of the trips in the test set.
+    """
+    X = filtered_data.loc[:, filtered_data.columns != TARGET]
+    vocabulary = features.fit_vocabulary(X)
+    codes, classes = pd.factorize(filtered_data[TARGET], sort=True)
+    train, test = train_test_split(np.arange(len(X)), test_size=test_size,
+                                   random_state=seed)
+    matrix = features.encode(X, vocabulary)
+    return {'X_train': matrix[train], 'X_test': matrix[test],
+            'y_train': codes[train].astype('int32'),
+            'y_test': codes[test].astype('int32'),
+            'classes': [str(name) for name in classes],
+            'vocabulary': vocabulary}
+
+
+def save_split(split, path):
+    """
+    Saves the split as numpy arrays in the directory. The directory
+    is written under a temporary name first, so that an interrupted
+    run never leaves a partial split behind.
+
+    @param split | the split, see build_split.
+    @param path  | the directory of the split.
+    """
+    partial = path + '.partial'
+    if os.path.exists(partial):
+        shutil.rmtree(partial)
+    os.makedirs(partial)
+    shapes = {}
+    for name in ['X_train', 'X_test']:
+        matrix = split[name]
+        for part in ['data', 'indices', 'indptr']:
+            np.save(os.path.join(partial, name + '.' + part + '.npy'),
+                    getattr(matrix, part))
+        shapes[name] = matrix.shape
+    for name in ['y_train', 'y_test']:
+        np.save(os.path.join(partial, name + '.npy'), split[name])
+    with open(os.path.join(partial, 'meta.json'), 'w') as f:
+        json.dump({'shapes': shapes, 'classes': split['classes']}, f)
+    features.save_vocabulary(split['vocabulary'],
+                             os.path.join(partial, 'vocabulary.json'))
+    os.replace(partial, path)
+
+
+def read_split(path):
+    """
+    Returns the split saved in the directory, with every array
+    memory-mapped from disk, and the directory as 'path'.
+
+    @param path | the directory of the split.
+    """
+    def array(name):
+        return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    split = {'path': path, 'classes': meta['classes'],
+             'vocabulary': features.load_vocabulary(
+                 os.path.join(path, 'vocabulary.json'))}
+    for name in ['X_train', 'X_test']:
+        split[name] = sparse.csr_matrix(
+            (array(name + '.data'), array(name + '.indices'),
+             array(name + '.indptr')), shape=tuple(meta['shapes'][name]),
+            copy=False)
+    for name in ['y_train', 'y_test']:
+        split[name] = array(name)
+    return split
+
+
+@instrument.stage
+def load_split(filtered_data, seed=SEED, test_size=TEST_SIZE,
+               cache_dir=None):
+    """
+    Returns the split of the trips, from the cache when the same
+    data was split with the same seed and test size before, and
+    builds and caches it otherwise.
+
+    @param filtered_data | filtered Citi Bike trip data.
+    @param seed          | random state of the split.
+    @param test_size     | share of the trips in the test set.
+    @param cache_dir     | directory of the cached splits, defaults
+                           to CACHE_DIR.
+    """
+    path = os.path.join(cache_dir or CACHE_DIR,
+                        split_key(filtered_data, seed, test_size))
+    if not os.path.exists(path):
+        save_split(build_split(filtered_data, seed, test_size), path)
+    return read_split(path)
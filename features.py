@@ -0,0 +1,120 @@
+"""
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+Encodes the trip features of the machine learning models as a
+sparse matrix: the numeric columns as they are and one column per
+category of the categorical columns (including the start station
+id). The categories are fitted once into a vocabulary that is saved
+with the model, so that the columns of the training data and of the
+trips scored later always line up.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+NUMERIC_COLUMNS = ['month', 'gender', 'age']
+CATEGORICAL_COLUMNS = ['Season', 'Peak', 'Period', 'usertype',
+                       'startstationid']
+
+
+def fit_vocabulary(X):
+    """
+    Returns the vocabulary of the features: the sorted categories
+    of every categorical column.
+
+    @param X | dataframe of the features.
+    """
+    vocabulary = {}
+    for column in CATEGORICAL_COLUMNS:
+        values = X[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.cat.remove_unused_categories().cat.categories
+        vocabulary[column] = sorted(pd.unique(np.asarray(values)).tolist())
+    return vocabulary
+
+
+def feature_names(vocabulary):
+    """
+    Returns the names of the columns of the encoded matrix,
+    named like pandas.get_dummies does (e.g. 'Season_Winter').
+
+    @param vocabulary | the vocabulary of the features.
+    """
+    return NUMERIC_COLUMNS + [
+        column + '_' + str(value) for column in CATEGORICAL_COLUMNS
+        for value in vocabulary[column]]
+
+
+def category_indexes(vocabulary):
+    """
+    Returns the categories of the vocabulary as pandas indexes,
+    which encode can reuse instead of building them at every call.
+
+    @param vocabulary | the vocabulary of the features.
+    """
+    return {column: pd.Index(vocabulary[column])
+            for column in CATEGORICAL_COLUMNS}
+
+
+def encode(X, vocabulary, indexes=None):
+    """
+    Returns the features as a CSR matrix of float32, one row per
+    trip and the columns of feature_names. Categories that are not
+    in the vocabulary get no column set.
+
+    @param X          | dataframe (or dict of arrays) of the
+                        features.
+    @param vocabulary | the vocabulary of the features.
+    @param indexes    | the category_indexes of the vocabulary, if
+                        already built.
+    """
+    indexes = indexes or category_indexes(vocabulary)
+    n = len(X[NUMERIC_COLUMNS[0]])
+    rows, columns, values = [], [], []
+    for i, column in enumerate(NUMERIC_COLUMNS):
+        rows.append(np.arange(n))
+        columns.append(np.full(n, i))
+        values.append(np.asarray(X[column], dtype='float32'))
+
+    offset = len(NUMERIC_COLUMNS)
+    for column in CATEGORICAL_COLUMNS:
+        categories = indexes[column]
+        codes = categories.get_indexer(np.asarray(X[column]))
+        known = np.flatnonzero(codes >= 0)
+        rows.append(known)
+        columns.append(offset + codes[known])
+        values.append(np.ones(len(known), dtype='float32'))
+        offset += len(categories)
+
+    matrix = sparse.csr_matrix(
+        (np.concatenate(values),
+         (np.concatenate(rows), np.concatenate(columns))),
+        shape=(n, offset), dtype='float32')
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def save_vocabulary(vocabulary, path):
+    """
+    Saves the vocabulary as json.
+
+    @param vocabulary | the vocabulary of the features.
+    @param path       | path of the file.
+    """
+    with open(path, 'w') as f:
+        json.dump(vocabulary, f, indent=2)
+
+
+def load_vocabulary(path):
+    """
+    Returns the vocabulary saved as json.
+
+    @param path | path of the file.
+    """
+    with open(path) as f:
+        return json.load(f)
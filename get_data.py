@@ -10,14 +10,47 @@ when used from other classes.
 """
 import os
 import sys
+import json
+import time
+import hashlib
+import collections
 import zipfile
-from urllib.request import urlretrieve
-import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import unquote, urlparse
+from urllib.request import Request, urlopen
 
+import numpy as np
 import pandas as pd
 
-
-def get_data(start_year, end_year, start_month):
+import cube
+import instrument
+import stations
+import trip_store
+
+MANIFEST_NAME = 'manifest.json'
+STATION_INDEX_NAME = '_stations.json'
+INGEST_MANIFEST_NAME = '_ingested.json'
+# Increase when the cleaning changes, so that refresh cleans
+# every month again
+CLEANING_VERSION = 1
+CHUNK_SIZE = 1 << 20
+# Manifest keys of the version of a month on the server
+REMOTE_KEYS = ['etag', 'last_modified', 'bytes']
+
+# Labels of the derived columns and the code of each hour or month:
+# Midnight 0-4, Morning 5-11, Afternoon 12-16, Evening 17-23,
+# Peak 6-9 and 16-19, Winter Dec-Feb, Spring Mar-May, ...
+PERIODS = ['Midnight', 'Morning', 'Afternoon', 'Evening']
+HOUR_PERIOD = np.array([0] * 5 + [1] * 7 + [2] * 5 + [3] * 7)
+PEAKS = ['Off Peak', 'Peak']
+HOUR_PEAK = np.array([0] * 6 + [1] * 4 + [0] * 6 + [1] * 4 + [0] * 4)
+SEASONS = ['Winter', 'Spring', 'Summer', 'Autumn']
+MONTH_SEASON = np.array([0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0])
+
+
+def get_data(start_year, end_year, start_month, stream=False):
     """
     Returns the data from the specified starting year and month
     to the ending year. The data is about Jersey City, Citi Bike
@@ -26,10 +59,15 @@ def get_data(start_year, end_year, start_month):
     @param start_year  | starting year
     @param end_year    | ending year
     @param start_month | starting month
+    @param stream      | read the csv files straight out of the zip
+                         files instead of extracting them first.
     """
     urls = get_urls(start_year, end_year, start_month)
 
     csv_file_path, zip_file_path = get_file_path()
+    if stream:
+        report = download_months(urls, zip_file_path)
+        return get_combined_zip_files([month['path'] for month in report])
     extract_files(urls, zip_file_path, csv_file_path)
     csv_file_path, zip_file_path = get_file_path()
 
@@ -77,133 +115,613 @@ def get_file_path():
     return (csv_file_path, zip_file_path)
 
 
-def extract_files(urls, zip_file_path, csv_file_path):
+@instrument.stage
+def extract_files(urls, zip_file_path, csv_file_path, workers=4):
     """
-    Extract files from zip and csv file and deletes
-    all temporary zip files.
+    Downloads every month concurrently, then extracts the zip
+    files. The zip files are kept so that a failed run can
+    resume where it stopped instead of starting from scratch.
 
     @param urls          | list containing all url links.
     @param zip_file_path | the zip file path name
     @param csv_file_path | the csv file path name
+    @param workers       | number of concurrent downloads.
     """
-    for i in range(len(urls)):
-        print("downloading " + urls[i])
-        zip_filename = zip_file_path + "/" + str(i + 1) + ".zip"
-        urlretrieve(urls[i], zip_filename)
-        print("extracting " + urls[i] + "\n")
-        extracting = zipfile.ZipFile(zip_filename)
-        extracting.extractall(csv_file_path)
+    report = download_months(urls, zip_file_path, workers)
+
+    for month in report:
+        print("extracting " + month['file'])
+        with zipfile.ZipFile(month['path']) as extracting:
+            extracting.extractall(csv_file_path)
 
     print("download & extract complete")
-    print("deleting all temporary zip files")
-    extracting.close()
-    shutil.rmtree(zip_file_path)
-    print("complete")
+    return report
+
+
+@instrument.stage
+def download_months(urls, zip_file_path, workers=4):
+    """
+    Downloads the monthly zip files with a bounded pool of
+    worker threads and returns a list with one report per month
+    (file, bytes, seconds, bytes/sec and whether it was skipped).
+
+    Months already present in the manifest with a matching
+    sha256 checksum are skipped, unless the server reports that
+    the file was published again, and partially downloaded files
+    are resumed with an HTTP range request.
+
+    @param urls          | list containing all url links.
+    @param zip_file_path | the zip file path name
+    @param workers       | maximum number of concurrent downloads.
+    """
+    manifest = read_manifest(zip_file_path)
+    lock = threading.Lock()
+
+    def work(url):
+        month = download_month(url, zip_file_path, manifest.get(
+            url_file_name(url)))
+        with lock:
+            manifest[month['file']] = dict(month['remote'], url=url,
+                                           sha256=month['sha256'],
+                                           bytes=month['size'])
+            write_manifest(zip_file_path, manifest)
+        return month
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        report = list(pool.map(work, urls))
+
+    for month in report:
+        if month['skipped']:
+            print("skipped " + month['file'] + " (checksum verified)")
+        else:
+            print("downloaded %s: %d bytes in %.2fs (%.0f bytes/sec)"
+                  % (month['file'], month['bytes'], month['seconds'],
+                     month['bytes_per_sec']))
+    return report
+
+
+def download_month(url, zip_file_path, entry=None):
+    """
+    Downloads a single month into the zip file path and returns
+    its report. A '.part' file left over from an earlier run is
+    resumed from its current size when the server supports it.
+
+    A month whose zip file matches the checksum of its manifest
+    entry is only skipped if a HEAD request shows the same ETag,
+    Last-Modified and Content-Length as when it was downloaded, so
+    that months published again upstream are downloaded again. If
+    the HEAD request fails, the month is skipped with a warning.
+
+    @param url           | url link of the month.
+    @param zip_file_path | the zip file path name
+    @param entry         | the manifest entry of the month, if any.
+    """
+    file_name = url_file_name(url)
+    path = os.path.join(zip_file_path, file_name)
+    month = {'url': url, 'file': file_name, 'path': path,
+             'bytes': 0, 'seconds': 0.0, 'bytes_per_sec': 0.0}
+
+    if entry is not None and os.path.exists(path) and \
+            file_checksum(path) == entry['sha256']:
+        try:
+            with urlopen(Request(url, method='HEAD')) as response:
+                remote = remote_version(response)
+        except URLError as error:
+            # Keep the verified file when the server cannot be asked
+            print("warning: could not check %s for a new version (%s)"
+                  % (file_name, error))
+            remote = {key: entry[key] for key in REMOTE_KEYS
+                      if key in entry}
+        if all(entry.get(key) == value for key, value in remote.items()):
+            month.update(skipped=True, sha256=entry['sha256'],
+                         size=entry['bytes'], remote=remote)
+            return month
+
+    part_path = path + '.part'
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    request = Request(url)
+    if offset > 0:
+        request.add_header('Range', 'bytes=%d-' % offset)
+
+    start = time.perf_counter()
+    try:
+        response = urlopen(request)
+    except HTTPError as error:
+        # 416: the partial file is already complete (or bigger than
+        # the remote file), so start over from the beginning.
+        if error.code != 416:
+            raise
+        offset = 0
+        response = urlopen(Request(url))
+    with response:
+        if offset > 0 and response.status != 206:
+            offset = 0
+        remote = remote_version(response)
+        with open(part_path, 'ab' if offset > 0 else 'wb') as out:
+            chunk = response.read(CHUNK_SIZE)
+            while chunk:
+                out.write(chunk)
+                month['bytes'] += len(chunk)
+                chunk = response.read(CHUNK_SIZE)
+    month['seconds'] = time.perf_counter() - start
+
+    os.replace(part_path, path)
+    if month['seconds'] > 0:
+        month['bytes_per_sec'] = month['bytes'] / month['seconds']
+    month.update(skipped=False, sha256=file_checksum(path),
+                 size=os.path.getsize(path))
+    # A range response only has the length of the part it sent
+    if 'bytes' in remote:
+        remote['bytes'] = month['size']
+    month['remote'] = remote
+    return month
+
+
+def remote_version(response):
+    """
+    Returns the ETag, Last-Modified and Content-Length headers
+    the server sent for a month as a dict with the keys 'etag',
+    'last_modified' and 'bytes'. Headers that are missing are left
+    out.
+
+    @param response | the http response of the month.
+    """
+    headers = response.headers
+    remote = {}
+    if headers.get('ETag') is not None:
+        remote['etag'] = headers['ETag']
+    if headers.get('Last-Modified') is not None:
+        remote['last_modified'] = headers['Last-Modified']
+    if headers.get('Content-Length') is not None:
+        remote['bytes'] = int(headers['Content-Length'])
+    return remote
+
+
+def url_file_name(url):
+    """
+    Returns the file name of the given url, e.g.
+    'JC-201509-citibike-tripdata.csv.zip'.
+
+    @param url | url link of the month.
+    """
+    return os.path.basename(unquote(urlparse(url).path))
+
+
+def file_checksum(path):
+    """
+    Returns the sha256 hex digest of the given file.
+
+    @param path | path of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
-def get_combined_csv_files(csv_file_path):
+def read_manifest(zip_file_path):
     """
-    Combines all the csv file and returns it.
+    Returns the download manifest of the zip file path, a dict
+    from file name to its url, sha256 checksum and size.
+
+    @param zip_file_path | the zip file path name
+    """
+    return read_json(os.path.join(zip_file_path, MANIFEST_NAME))
+
+
+def write_manifest(zip_file_path, manifest):
+    """
+    Saves the download manifest of the zip file path.
+
+    @param zip_file_path | the zip file path name
+    @param manifest      | dict from file name to its entry.
+    """
+    write_json(os.path.join(zip_file_path, MANIFEST_NAME), manifest)
+
+
+def read_json(path):
+    """
+    Returns the dict saved in the json file, or an empty dict if
+    the file does not exist.
+
+    @param path | path of the json file.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    """
+    Saves the dict to the json file, replacing it atomically.
+
+    @param path | path of the json file.
+    @param data | the dict to save.
+    """
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+@instrument.stage
+def get_combined_csv_files(csv_file_path, workers=None, as_iterator=False):
+    """
+    Combines all the csv file and returns it. The months are read
+    in parallel and concatenated once at the end.
 
     @param csv_file_path | the csv file path name
+    @param workers       | number of worker processes, defaults to
+                           the number of CPUs.
+    @param as_iterator   | return an iterator of the per-month
+                           dataframes instead of one combined
+                           dataframe (the raw trip store is not written).
     """
-    trip_file_list = []
-    all_trip_file = pd.DataFrame()
+    if as_iterator:
+        return iter_month_frames(csv_file_path, workers)
+
     print("Combining CSV Files: Started")
-    for file_name in os.listdir(csv_file_path):
-        trip_file_list.append(file_name)
+    all_trip_file = trip_store.concat_trips(
+        iter_month_frames(csv_file_path, workers))
+
+    # The station table keeps the names and coordinates, the raw
+    # trip store only the station ids
+    stations.update_station_store(all_trip_file)
+    trip_store.write_trips(stations.drop_details(all_trip_file),
+                           trip_store.RAW_STORE, overwrite=True)
+    print("Combining CSV Files: Complete")
+    return all_trip_file
 
-    for i in range(len(trip_file_list)):
-        df = pd.read_csv(csv_file_path + "/" + trip_file_list[i])
-        df.columns = map(str.lower, df.columns)
-        df.columns = df.columns.str.replace(' ', '')
-        all_trip_file = all_trip_file.append(df, ignore_index=True)
 
-    all_trip_file.to_csv(sys.path[0] + '/bike_data.csv',
-                         index=None, header=True)
-    print("Combining CSV Files: Complete")
+def iter_month_frames(csv_file_path, workers=None):
+    """
+    Yields the dataframe of every csv file in the csv file path,
+    in file name order, reading them with a pool of processes.
+    At most one month per worker is read ahead of the consumer, so
+    a slow consumer never holds more than that many months.
+
+    @param csv_file_path | the csv file path name
+    @param workers       | number of worker processes, defaults to
+                           the number of CPUs.
+    """
+    trip_file_list = [os.path.join(csv_file_path, file_name)
+                      for file_name in sorted(os.listdir(csv_file_path))
+                      if file_name.endswith('.csv')]
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for filename in trip_file_list:
+            if len(pending) == workers:
+                yield pending.popleft().result()
+            pending.append(pool.submit(read_month_csv, filename))
+        while pending:
+            yield pending.popleft().result()
+
+
+def read_month_csv(filename):
+    """
+    Reads a single month csv file and returns it with normalized
+    column names and the compact trip data types.
+
+    @param filename | the csv file name
+    """
+    df = pd.read_csv(filename)
+    normalize_columns(df)
+    return trip_store.compact_trips(df, os.path.basename(filename))
+
+
+@instrument.stage
+def get_combined_zip_files(zip_paths):
+    """
+    Combines the csv files inside the given zip files and returns
+    it, without ever extracting the csv files to disk. The
+    combined data is still saved to the raw trip store, and its
+    stations to the station table.
+
+    @param zip_paths | list of the monthly zip file paths.
+    """
+    print("Combining ZIP Files: Started")
+    chunks = []
+    write_store = store_sink(trip_store.RAW_STORE)
+
+    def sink(chunk):
+        chunks.append(chunk)
+        stations.update_station_store(chunk)
+        write_store(chunk)
+
+    stream_zip_files(zip_paths, sink)
+    all_trip_file = trip_store.concat_trips(chunks)
+    print("Combining ZIP Files: Complete")
     return all_trip_file
 
 
-def data_cleaning(bike_data):
+def stream_zip_files(zip_paths, sink, chunksize=500000):
+    """
+    Reads every csv member of the given zip files as a stream,
+    in chunks of at most chunksize rows, and passes each chunk
+    with normalized column names and the compact trip data types
+    to the sink. Returns the number
+    of rows read.
+
+    @param zip_paths | list of the monthly zip file paths.
+    @param sink      | function called with every chunk.
+    @param chunksize | number of rows per chunk.
+    """
+    rows = 0
+    for zip_path in zip_paths:
+        with zipfile.ZipFile(zip_path) as archive:
+            for member in archive.namelist():
+                # skip folders and macOS resource forks
+                if not member.endswith('.csv') or \
+                        member.startswith('__MACOSX'):
+                    continue
+                print("streaming " + member)
+                with archive.open(member) as f:
+                    for chunk in pd.read_csv(f, chunksize=chunksize):
+                        normalize_columns(chunk)
+                        trip_store.apply_schema(chunk)
+                        rows += len(chunk)
+                        sink(chunk)
+    return rows
+
+
+def store_sink(store_path):
+    """
+    Returns a sink that appends every chunk it is given to the
+    trip store, replacing the existing store on the first chunk.
+    Only the station ids of the trips are stored, their names and
+    coordinates belong in the station table.
+
+    @param store_path | the directory of the store.
+    """
+    state = {'overwrite': True}
+
+    def sink(chunk):
+        trip_store.write_trips(stations.drop_details(chunk), store_path,
+                               overwrite=state['overwrite'])
+        state['overwrite'] = False
+
+    return sink
+
+
+def normalize_columns(df):
+    """
+    Makes the column names lower case without spaces, as they
+    differ between the 2015 and 2017+ csv files
+    (e.g. 'Start Station Name' and 'startstationname').
+
+    @param df | the dataframe to be modified.
+    """
+    df.columns = df.columns.str.lower().str.replace(' ', '')
+
+
+@instrument.stage
+def data_cleaning(bike_data, output=None):
     """
     Cleans the data by removing age outliers, null values,
     and adds new columns of periods, peaks, seasons, and
-    age.
+    age. Returns the cleaned data.
 
     @param bike_data | Tripdata from Jersey City Citi Bikes.
+    @param output    | the directory of the cleaned trip store,
+                       defaults to trip_store.CLEAN_STORE.
     """
     print('Cleaning Data: Starting')
+    output = output or trip_store.CLEAN_STORE
 
-    # Drop NaN
+    # Drop NaN, only looking at the columns the raw trip store keeps
+    # so that data_cleaning_chunked and refresh drop the same trips
     df = bike_data
-    df = df.dropna()
+    df = df.loc[stations.drop_details(df).notna().all(axis=1)]
 
     # Remove the data that destinations are in New York City
-    jersey = set(df['startstationname'])
-    df = df.loc[df['endstationname'].isin(jersey)]
+    jersey = set(df['startstationid'])
+    df = df.loc[df['endstationid'].isin(jersey)]
 
-    add_column_periods(df)
-    add_column_peaks(df)
-    add_column_seasons(df)
-    add_column_age(df)
+    df = add_derived_columns(df)
 
-    df.to_csv('fliterd_data.csv', index=None, header=True)
+    # The cleaned trips only keep the station ids
+    trip_store.write_trips(stations.drop_details(df), output,
+                           overwrite=True)
+    cube.write_cube(cube.build_cube(df), output)
     print('Cleaning Data: Completed')
+    return df
 
 
-def add_column_periods(df):
+@instrument.stage
+def data_cleaning_chunked(store_path=trip_store.RAW_STORE,
+                          output=trip_store.CLEAN_STORE, memory_limit=512):
+    """
+    Cleans the data of the raw trip store like data_cleaning, but
+    in chunks sized to stay below the memory limit, appending each
+    cleaned chunk to the output store, and saves the cube of all the
+    chunks with it. Returns the number of rows written.
+
+    The Jersey City stations depend on all the trips, so they are
+    collected in a first pass (or read from the station index saved
+    by an earlier run) before any chunk is cleaned.
+
+    @param store_path   | the directory of the raw trip store.
+    @param output       | the directory of the cleaned trip store.
+    @param memory_limit | memory ceiling of a chunk in MB.
     """
-    Add new column to the dataframe representing
-    morning/afternoon/evening/midnight
+    print('Cleaning Data in chunks: Starting')
+    batch_rows = chunk_rows(store_path, memory_limit)
+
+    jersey = read_station_index(store_path)
+    if jersey is None:
+        jersey = set()
+        for chunk in trip_store.iter_trips(store_path, batch_rows):
+            jersey.update(chunk.dropna()['startstationid'].unique())
+        write_station_index(store_path, jersey)
+
+    rows = 0
+    sink = store_sink(output)
+    trip_cube = cube.merge_cubes([])
+    for chunk in trip_store.iter_trips(store_path, batch_rows):
+        chunk = chunk.dropna()
+        chunk = chunk.loc[chunk['endstationid'].isin(jersey)]
+        chunk = add_derived_columns(chunk)
+        if len(chunk) > 0:
+            sink(chunk)
+            trip_cube = cube.merge_cubes([trip_cube, cube.build_cube(chunk)])
+            rows += len(chunk)
+    cube.write_cube(trip_cube, output)
+
+    print('Cleaning Data in chunks: Completed')
+    return rows
+
+
+def chunk_rows(store_path, memory_limit):
+    """
+    Returns how many rows of the store can be cleaned at once
+    without going over the memory limit, measured on a sample.
+    Cleaning keeps about four copies of a chunk alive (the chunk,
+    dropna, the station filter and the derived columns).
 
-    @param df | the dataframe to be modified.
+    @param store_path   | the directory of the raw trip store.
+    @param memory_limit | memory ceiling of a chunk in MB.
     """
-    df.loc[:, 'Hour'] = pd.to_datetime(df['starttime']).dt.hour
-    df.loc[df['Hour'] < 5, 'Period'] = 'Midnight'
-    df.loc[(df['Hour'] >= 5) & (df['Hour'] < 12), 'Period'] = 'Morning'
-    df.loc[(df['Hour'] >= 12) & (df['Hour'] < 17), 'Period'] = 'Afternoon'
-    df.loc[df['Hour'] >= 17, 'Period'] = 'Evening'
+    sample = next(trip_store.iter_trips(store_path, 10000))
+    row_bytes = sample.memory_usage(deep=True).sum() / len(sample)
+    return max(1000, int(memory_limit * 2 ** 20 / (4 * row_bytes)))
 
 
-def add_column_peaks(df):
+def read_station_index(store_path):
     """
-    Add new column to the dataframe representing peak/off-peak
+    Returns the set of Jersey City station ids saved for the
+    store, or None if there is none.
 
-    @param df | the dataframe to be modified.
+    @param store_path | the directory of the raw trip store.
     """
-    df.loc[((df['Hour'] >= 6) & (df['Hour'] < 10)) | ((df['Hour'] >= 16) &
-           (df['Hour'] < 20)), 'Peak'] = 'Peak'
-    df.loc[df['Peak'] != 'Peak', 'Peak'] = 'Off Peak'
+    path = os.path.join(store_path, STATION_INDEX_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return set(json.load(f))
 
 
-def add_column_seasons(df):
+def write_station_index(store_path, jersey):
     """
-    Add a new column to the dataframe representing the
-    different seasons: Winter, Spring, Summer, and Autumn.
+    Saves the set of Jersey City station ids for the store.
 
-    @param df | the dataframe to be modified.
+    @param store_path | the directory of the raw trip store.
+    @param jersey     | set of station ids.
     """
-    df.loc[:, 'month'] = pd.to_datetime(df['starttime']).dt.month
-    df.loc[(df['month'] == 12) | (df['month'] == 1) |
-           (df['month'] == 2), 'Season'] = 'Winter'
-    df.loc[(df['month'] == 3) | (df['month'] == 4) |
-           (df['month'] == 5), 'Season'] = 'Spring'
-    df.loc[(df['month'] == 6) | (df['month'] == 7) |
-           (df['month'] == 8), 'Season'] = 'Summer'
-    df.loc[(df['month'] == 9) | (df['month'] == 10) |
-           (df['month'] == 11), 'Season'] = 'Autumn'
+    path = os.path.join(store_path, STATION_INDEX_NAME)
+    with open(path, 'w') as f:
+        json.dump(sorted(int(station) for station in jersey), f, indent=2)
 
 
-def add_column_age(df):
+@instrument.stage
+def refresh(start_year, end_year, start_month, workers=4):
     """
-    Changes the dataframes' birth year to age and filters outliers
+    Brings the raw and cleaned trip stores up to date by only
+    processing the months that are new, whose zip file changed, or
+    that were cleaned by another version of the cleaning. Returns
+    the file names of the months that were processed.
 
-    @param df | the dataframe to be modified.
+    @param start_year  | starting year
+    @param end_year    | ending year
+    @param start_month | starting month
+    @param workers     | number of concurrent downloads.
     """
-    df.loc[:, 'year'] = pd.to_datetime(df['starttime']).dt.year
-    df.loc[:, 'age'] = df['year'] - df['birthyear']
-    df = df.loc[df['age'] < 90, :]
+    urls = get_urls(start_year, end_year, start_month)
+    csv_file_path, zip_file_path = get_file_path()
+    return refresh_months(urls, zip_file_path, workers=workers)
+
+
+def refresh_months(urls, zip_file_path, store_path=trip_store.RAW_STORE,
+                   output=trip_store.CLEAN_STORE, station_path=None,
+                   workers=4):
+    """
+    Downloads the months of the urls and processes the pending ones
+    into the raw and cleaned trip stores, see refresh. Returns the
+    file names of the months that were processed.
+
+    The Jersey City stations are the saved station index plus the
+    start stations of the new months; months cleaned earlier are
+    not filtered again when new stations appear.
+
+    @param urls          | list containing all url links.
+    @param zip_file_path | the zip file path name
+    @param store_path    | the directory of the raw trip store.
+    @param output        | the directory of the cleaned trip store.
+    @param station_path  | path of the station store, defaults to
+                           stations.STATION_STORE.
+    @param workers       | number of concurrent downloads.
+    """
+    report = download_months(urls, zip_file_path, workers)
+
+    ingested = read_json(os.path.join(output, INGEST_MANIFEST_NAME))
+    pending = [month for month in report if ingested.get(month['file']) !=
+               {'sha256': month['sha256'], 'version': CLEANING_VERSION}]
+    print('Refreshing %d of %d months' % (len(pending), len(report)))
+    if len(pending) == 0:
+        return []
+
+    # Replace the raw partitions of the pending months. Citi Bike
+    # files hold the trips starting in their month, so each file
+    # replaces exactly one partition.
+    jersey = read_station_index(store_path) or set()
+    partitions = set()
+    for month in pending:
+        chunks = []
+        stream_zip_files([month['path']], chunks.append)
+        df = trip_store.concat_trips(chunks)
+        stations.update_station_store(df, station_path)
+        trip_store.write_trips(stations.drop_details(df), store_path,
+                               replace=True)
+        jersey.update(df.dropna()['startstationid'].unique())
+        partitions.update(zip(df['starttime'].dt.year,
+                              df['starttime'].dt.month))
+    write_station_index(store_path, jersey)
+
+    # Clean them again with the updated station index
+    cubes = []
+    for year, month in sorted(partitions):
+        df = trip_store.read_trips(store_path, years=[year], months=[month])
+        df = df.dropna()
+        df = add_derived_columns(df.loc[df['endstationid'].isin(jersey)])
+        trip_store.write_trips(stations.drop_details(df), output,
+                               replace=True)
+        cubes.append(cube.build_cube(df))
+    cube.replace_months(cube.merge_cubes(cubes), partitions, output)
+
+    for month in pending:
+        ingested[month['file']] = {'sha256': month['sha256'],
+                                   'version': CLEANING_VERSION}
+    write_json(os.path.join(output, INGEST_MANIFEST_NAME), ingested)
+    return [month['file'] for month in pending]
+
+
+def add_derived_columns(df):
+    """
+    Returns the dataframe with the derived columns Hour, Period,
+    Peak, month, Season, year and age added, and the age outliers
+    removed. The start time is parsed only once, and the labels
+    are looked up in HOUR_PERIOD, HOUR_PEAK and MONTH_SEASON.
+
+    @param df | the dataframe to be extended.
+    """
+    start = trip_store.parse_starttime(df['starttime'])
+    hour = start.dt.hour.to_numpy()
+    month = start.dt.month.to_numpy()
+    year = start.dt.year.to_numpy()
+
+    df = df.assign(
+        starttime=start,
+        Hour=hour.astype('int8'),
+        Period=pd.Categorical.from_codes(HOUR_PERIOD[hour], PERIODS),
+        Peak=pd.Categorical.from_codes(HOUR_PEAK[hour], PEAKS),
+        month=month.astype('int8'),
+        Season=pd.Categorical.from_codes(MONTH_SEASON[month - 1], SEASONS),
+        year=year.astype('int16'),
+        age=(year - df['birthyear'].to_numpy(dtype='int16')).astype('int16'))
+
+    # Remove age outliers
+    return df.loc[df['age'] < 90, :]
 
 
 def main():
@@ -211,6 +729,7 @@ def main():
     Saves the trip datas from CitiBike and cleans it.
     """
     data_cleaning(get_data(2015, 2019, 9))
+    instrument.write_report()
 
 
 if __name__ == '__main__':
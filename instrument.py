@@ -0,0 +1,145 @@
+"""
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+Records the wall time, CPU time, rows in/out and peak memory of
+every stage of the pipeline, so that a slow run shows which stage
+was slow. Stages are functions decorated with @instrument.stage or
+blocks inside `with instrument.measure(name):`, and the records are
+saved as a json run report with write_report.
+
+Setting the environment variable PROFILE_STAGE to the name of a
+stage (e.g. question1_final.get_bike_stations) also saves a cProfile
+dump of that stage to '<stage>.prof'.
+"""
+import os
+import sys
+import json
+import time
+import cProfile
+import resource
+import functools
+import threading
+import contextlib
+
+REPORT_PATH = sys.path[0] + '/run_report.json'
+# How often the memory of a running stage is sampled, in seconds
+SAMPLE_INTERVAL = 0.01
+
+RECORDS = []
+RUN_START = time.time()
+
+
+def current_rss():
+    """
+    Returns the resident memory of the process in bytes. Where
+    /proc is not available, the peak of the whole process is used.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # ru_maxrss is in bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def count_rows(value):
+    """
+    Returns the number of rows of a dataframe, geodataframe or
+    array, or None for anything else.
+
+    @param value | the value to count.
+    """
+    shape = getattr(value, 'shape', None)
+    if shape is None or len(shape) == 0:
+        return None
+    return int(shape[0])
+
+
+@contextlib.contextmanager
+def measure(name, rows_in=None):
+    """
+    Measures the block as a stage with the given name and adds its
+    record to RECORDS. The block gets the record, and may set its
+    'rows_out'.
+
+    @param name    | name of the stage.
+    @param rows_in | number of input rows, if known.
+    """
+    record = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+    peak = [current_rss()]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(SAMPLE_INTERVAL):
+            peak[0] = max(peak[0], current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    profiler = None
+    if os.environ.get('PROFILE_STAGE') == name:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start_rss = peak[0]
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield record
+    finally:
+        record['wall_seconds'] = time.perf_counter() - wall
+        record['cpu_seconds'] = time.process_time() - cpu
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(name + '.prof')
+        done.set()
+        sampler.join()
+        peak[0] = max(peak[0], current_rss())
+        record['start_rss_mb'] = start_rss / 2 ** 20
+        record['peak_rss_mb'] = peak[0] / 2 ** 20
+        RECORDS.append(record)
+
+
+def stage(func):
+    """
+    Decorates a function so that every call is measured as a stage
+    named '<module>.<function>'. The rows in are the rows of the
+    first argument and the rows out are the rows of the result.
+
+    @param func | the function to decorate.
+    """
+    module = func.__module__
+    if module == '__main__':
+        module = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    name = module + '.' + func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        rows_in = count_rows(args[0]) if len(args) > 0 else None
+        with measure(name, rows_in) as record:
+            result = func(*args, **kwargs)
+            record['rows_out'] = count_rows(result)
+        return result
+
+    return wrapper
+
+
+def write_report(path=REPORT_PATH):
+    """
+    Saves the records of all the stages run so far as a json run
+    report, and prints a summary of them.
+
+    @param path | path of the json report.
+    """
+    report = {'command': sys.argv, 'started': time.strftime(
+        '%Y-%m-%dT%H:%M:%S', time.localtime(RUN_START)), 'stages': RECORDS}
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for record in RECORDS:
+        print('%-45s %9.2fs wall %9.2fs cpu %9.1f MB peak' % (
+            record['stage'], record['wall_seconds'], record['cpu_seconds'],
+            record['peak_rss_mb']))
+    print('Run report saved to ' + path)
@@ -7,18 +7,41 @@ Gets all the respective Jersey City, CitiBike datas and
 organizes/reformats it the data for it to compatible
 when used from other classes.
 """
+import numpy as np
 import pandas as pd
 from sklearn.tree import DecisionTreeClassifier
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 from sklearn.neural_network import MLPClassifier
 
 import seaborn as sns
-import matplotlib.pyplot as plt
+
+import dataset
+import features
+import instrument
+import render
+import stations
+import sweep
+import trip_store
 
 sns.set()
 
+FEATURE_COLUMNS = ['Season', 'month', 'Peak', 'gender', 'Period', 'age',
+                   'usertype', 'endstationname', 'startstationid']
+
+
+def split_data(filtered_data):
+    """
+    Returns the encoded train and test features and end stations
+    of the trips, from the split shared by all the models.
 
+    @param filtered_data | filtered Citi Bike trip data.
+    """
+    split = dataset.load_split(filtered_data)
+    return split['X_train'], split['X_test'], split['y_train'], \
+        split['y_test']
+
+
+@instrument.stage
 def decision_tree_classifier(filtered_data, max_depth=20):
     """
     Fits and predicts the end station name using
@@ -28,53 +51,99 @@ def decision_tree_classifier(filtered_data, max_depth=20):
 
     @param filtered_data | filtered Citi Bike trip data.
     """
-    X = filtered_data.loc[:, filtered_data.columns != 'endstationname']
-    X = pd.get_dummies(X)
-    y = filtered_data['endstationname']
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2)
+    split = dataset.load_split(filtered_data)
 
-    model = DecisionTreeClassifier(max_depth)
+    model = DecisionTreeClassifier(max_depth=max_depth,
+                                   random_state=dataset.SEED)
 
-    model.fit(X_train, y_train)
-    print(accuracy_score(y_test, model.predict(X_test)))
-    print(dict(zip(X, model.feature_importances_)))
+    model.fit(split['X_train'], split['y_train'])
+    print(accuracy_score(split['y_test'], model.predict(split['X_test'])))
+    # Named by the vocabulary the split was encoded with
+    print(dict(zip(features.feature_names(split['vocabulary']),
+                   model.feature_importances_)))
 
 
+@instrument.stage
 def plot_dtc_accuracy(filtered_data):
     """
     Plots the decision tree classifiers training
-    and test accuracy over a max depth.
+    and test accuracy over a max depth, for every max depth
+    up to the depth of a fully grown tree.
 
     @param filtered_data | filtered Citi Bike trip data.
     """
-    X = filtered_data.loc[:, filtered_data.columns != 'endstationname']
-    X = pd.get_dummies(X)
-    y = filtered_data['endstationname']
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2,
-                                                        random_state=1)
-
-    data = []
-    for i in range(1, 102, 10):
-        model = DecisionTreeClassifier(max_depth=i, random_state=1)
-        model.fit(X_train, y_train)
-        print(i)
-
-        y_train_pred = model.predict(X_train)
-        train_acc = accuracy_score(y_train, y_train_pred)
+    X_train, X_test, y_train, y_test = split_data(filtered_data)
 
-        y_test_pred = model.predict(X_test)
-        test_acc = accuracy_score(y_test, y_test_pred)
-
-        data.append({'max depth': i, 'train accuracy': train_acc,
-                    'test accuracy': test_acc})
+    model = DecisionTreeClassifier(random_state=dataset.SEED)
+    model.fit(X_train, y_train)
+    train_acc = depth_accuracy(model, X_train, y_train)
+    test_acc = depth_accuracy(model, X_test, y_test)
+    data = pd.DataFrame({'max depth': np.arange(1, len(train_acc) + 1),
+                         'train accuracy': train_acc,
+                         'test accuracy': test_acc})
+    render.render_all([
+        (draw_dtc_accuracy, (data, 'train accuracy'), 'train_dtc'),
+        (draw_dtc_accuracy, (data, 'test accuracy'), 'test_dtc')])
+    return data
+
+
+def depth_accuracy(model, X, y, batch_rows=100000):
+    """
+    Returns the accuracy of the fitted tree cut at every max depth
+    from 1 to its depth, as an array.
+
+    A tree grown with a max depth d is the fully grown tree with
+    the nodes below depth d removed (up to ties between equally
+    good splits), so a trip is predicted by the node of its path at
+    depth d, or by its leaf when the path is shorter. The paths of
+    the trips are walked once, in batches of batch_rows trips.
+
+    @param model      | the fitted DecisionTreeClassifier.
+    @param X          | the features.
+    @param y          | the end stations.
+    @param batch_rows | number of trips per batch.
+    """
+    tree = model.tree_
+    depth = np.zeros(tree.node_count, dtype='int64')
+    nodes, level = np.array([0]), 0
+    while len(nodes) > 0:
+        depth[nodes] = level
+        nodes = np.concatenate([tree.children_left[nodes],
+                                tree.children_right[nodes]])
+        nodes, level = nodes[nodes >= 0], level + 1
+    node_class = model.classes_[np.argmax(tree.value[:, 0, :], axis=1)]
+    levels = model.get_depth() + 1
+
+    # reached[k]: correct trips whose path has a node at depth k
+    # ended[k]: correct trips whose leaf is at depth k
+    reached = np.zeros(levels)
+    ended = np.zeros(levels)
+    y = np.asarray(y)
+    for start in range(0, X.shape[0], batch_rows):
+        paths = model.decision_path(X[start:start + batch_rows])
+        lengths = np.diff(paths.indptr)
+        correct = node_class[paths.indices] == np.repeat(
+            y[start:start + batch_rows], lengths)
+        node_depth = depth[paths.indices]
+        reached += np.bincount(node_depth, weights=correct, minlength=levels)
+        leaves = paths.indptr[1:] - 1
+        ended += np.bincount(node_depth[leaves], weights=correct[leaves],
+                             minlength=levels)
+    return (reached[1:] + np.cumsum(ended)[:-1]) / X.shape[0]
+
+
+def draw_dtc_accuracy(data, accuracy):
+    """
+    Returns the figure of the accuracy over the max depth.
 
-    data = pd.DataFrame(data)
-    sns.relplot(kind='line', x='max depth', y='train accuracy', data=data)
-    plt.savefig('train_dtc.png')
-    sns.relplot(kind='line', x='max depth', y='test accuracy', data=data)
-    plt.savefig('test_dtc.png')
+    @param data     | the accuracy of every max depth.
+    @param accuracy | 'train accuracy' or 'test accuracy'.
+    """
+    return sns.relplot(kind='line', x='max depth', y=accuracy,
+                       data=data).figure
 
 
+@instrument.stage
 def mlp_classifier(filtered_data):
     """
     Fits and predicts the end station name using
@@ -83,14 +152,10 @@ def mlp_classifier(filtered_data):
 
     @param filtered_data | filtered Citi Bike trip data.
     """
-    X = filtered_data.loc[:, filtered_data.columns != 'endstationname']
-    X = pd.get_dummies(X)
-    X = X.astype('int8')
-    y = filtered_data['endstationname']
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2,
-                                                        random_state=1)
+    X_train, X_test, y_train, y_test = split_data(filtered_data)
 
-    mlp = MLPClassifier(hidden_layer_sizes=(150, 150, 150), random_state=1)
+    mlp = MLPClassifier(hidden_layer_sizes=(150, 150, 150),
+                        random_state=dataset.SEED)
 
     mlp.fit(X_train, y_train)
     print('Training score', mlp.score(X_train, y_train))
@@ -98,29 +163,26 @@ def mlp_classifier(filtered_data):
     print('Accuracy score', accuracy_score(y_test, mlp.predict(X_test)))
 
 
-def tune_hyperparameters(filtered_data):
+@instrument.stage
+def tune_hyperparameters(filtered_data, cpus=None):
     """
-    Print out the training set and test set score results
-    of different hyperparameters for the MLPClassifier.
+    Runs a sweep of different hyperparameters for the MLPClassifier
+    in parallel, and returns and prints out the training set and
+    test set score results. Results of an interrupted sweep are
+    kept, and only the missing ones are run again.
 
     @param filtered_data | filtered Citi Bike trip data.
+    @param cpus          | CPU budget of the sweep, defaults to all
+                           the CPUs.
     """
-    X = filtered_data.loc[:, filtered_data.columns != 'endstationname']
-    X = pd.get_dummies(X)
-    y = filtered_data['endstationname']
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2)
-
     learning_rates = [0.01, 0.5, 1.0]
     sizes = [(10,), (50,), (10, 10, 10, 10), (100, 100, 100), (150, 150, 150)]
-    for learning_rate in learning_rates:
-        for size in sizes:
-            print(f'Learning Rate {learning_rate}, Size {size}')
-            mlp = MLPClassifier(hidden_layer_sizes=size, max_iter=10,
-                                random_state=1,
-                                learning_rate_init=learning_rate)
-            mlp.fit(X_train, y_train)
-            print("    Training set score: %f" % mlp.score(X_train, y_train))
-            print("    Test set score: %f" % mlp.score(X_test, y_test))
+    configs = [{'learning_rate': learning_rate, 'size': size}
+               for learning_rate in learning_rates for size in sizes]
+    results = sweep.run_sweep(dataset.load_split(filtered_data), configs,
+                              max_iter=10, cpus=cpus)
+    print(results.to_string(index=False))
+    return results
 
 
 def filter_data(data):
@@ -129,23 +191,37 @@ def filter_data(data):
 
     @param data | Citi Bike trip data.
     """
-    filtered_data = data.loc[:, ['Season', 'month', 'Peak', 'gender', 'Period',
-                                 'age', 'usertype', 'endstationname',
-                                 'startstationid']]
+    filtered_data = data.loc[:, FEATURE_COLUMNS]
     return filtered_data
 
 
+def load_data():
+    """
+    Returns the cleaned trips with the columns the models need.
+    """
+    with instrument.measure('ml_model.load') as record:
+        # The trips only store the end station id,
+        # the name comes from the station table
+        columns = FEATURE_COLUMNS[:]
+        columns[columns.index('endstationname')] = 'endstationid'
+        data = trip_store.load_trips(columns)
+        data['endstationname'] = stations.station_names(
+            data['endstationid'], stations.read_stations())
+        record['rows_out'] = len(data)
+    return data
+
+
 def main():
     """
     Calls the machine learning models.
     """
-    data = pd.read_csv('filtered_bike_data.csv')
-    filtered_data = filter_data(data)
+    filtered_data = filter_data(load_data())
 
     decision_tree_classifier(filtered_data)
     # plot_dtc_accuracy(filtered_data, 20)
     # neural_network(filtered_data)
     # tune_hyperparameters(filtered_data)
+    instrument.write_report()
 
 
 if __name__ == '__main__':
@@ -1,42 +1,69 @@
-import pandas as pd
+import sys
+
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+import cube
+import instrument
+import render
+
+# Labels of the gender codes of Citi Bike
+GENDERS = {0: "unknown", 1: "male", 2: "female"}
+STYLE = {"xtick.major.size": 20, "ytick.major.size": 20}
+
 
 def main():
-    sample = readcsv(sys.path[0] + '/bike_data.csv')
-    lineplot(sample)
-    barplot(sample)
-    freqplot(sample)
+    """
+    read the aggregate cube of the cleaned trips,
+    compute the tables of the plots from it and render them
+    the figure format and dpi can be given as arguments,
+    e.g. python plot.py svg 200
+    """
+    fmt = sys.argv[1] if len(sys.argv) > 1 else "png"
+    dpi = int(sys.argv[2]) if len(sys.argv) > 2 else render.DPI
+    with instrument.measure("plot.load") as record:
+        trip_cube = cube.read_cube()
+        record["rows_out"] = len(trip_cube)
+    render.render_all(plot_jobs(trip_cube), fmt, dpi)
+    instrument.write_report()
 
 
-def readcsv(filename):
+def plot_jobs(trip_cube):
     """
-    read the csv file with the given file name
-    add the year column to the data
-    return the dataframe of the csv file
+    take in the aggregate cube of the trips
+    return the render jobs of the plots
     """
-    df = pd.read_csv(filename)
-    df["year"] = pd.to_datetime(df["starttime"]).dt.year
-    return df
+    return [(draw_lineplot, lineplot(trip_cube), "lineplots"),
+            (draw_barplot, barplot(trip_cube), "barplots"),
+            (draw_freqplot, freqplot(trip_cube), "freqplots")]
 
 
+@instrument.stage
 def lineplot(data):
     """
-    take in a dataframe
-    draw line plots and save the fiugre as lineplots.png
+    take in the aggregate cube
+    return the average trip duration of every year and gender
+    and of every year and user type
     """
-    sample = data
-    sns.set_style('darkgrid', {"xtick.major.size": 20, "ytick.major.size": 20})
-    plt.tight_layout()
-    with sns.plotting_context(rc={"legend.fontsize": 17}):
+    # the average trip duration of different years
+    # showing the difference between genders
+    years_gender = cube.rollup(data, ["year", "gender"])
+    years_gender["gender"] = years_gender["gender"].map(GENDERS)
 
+    # the average trip duration of different years
+    # showing the difference between usertypes
+    years_type = cube.rollup(data, ["year", "usertype"])
+    return years_gender, years_type
+
+
+def draw_lineplot(years_gender, years_type):
+    """
+    take in the tables of lineplot
+    draw line plots and return the figure
+    """
+    with sns.axes_style("darkgrid", STYLE), \
+            sns.plotting_context(rc={"legend.fontsize": 17}):
         linefig, ax = plt.subplots(2, figsize=(8, 11))
-        # plot the average trip duration of different years
-        # showing the difference between genders
-        years_gender = sample.groupby(["year", "gender"])["tripduration"]\
-            .mean()
-        years_gender = years_gender.reset_index()
         sns.lineplot(x="year", y="tripduration", hue="gender", legend="brief",
                      data=years_gender, ax=ax[0])
         ax[0].set_title("relation between gender and average trip duriation",
@@ -46,76 +73,75 @@ def lineplot(data):
 
         ax[0].set_xticklabels(years_gender["year"])
 
-        legend = ax[0].legend()
-        legend.get_texts()[1].set_text("unknown")
-        legend.get_texts()[2].set_text("male")
-        legend.get_texts()[3].set_text("female")
-
-        # plot the average trip duration of different years
-        # showing the difference between usertypes
-        years_type = sample.groupby(["year", "usertype"])["tripduration"]\
-            .mean()
         sns.lineplot(x="year", y="tripduration", hue="usertype",
-                     legend="brief", data=years_type.reset_index(), ax=ax[1])
+                     legend="brief", data=years_type, ax=ax[1])
         ax[1].set_title("relation between user type and \
                         average trip duriation", fontsize=20)
         ax[1].set_xlabel("year", fontsize=18)
         ax[1].set_ylabel("trip duriation", fontsize=18)
 
         ax[0].set_xticklabels(years_gender["year"])
-
-        linefig.savefig("lineplots.png")
+    return linefig
 
 
+@instrument.stage
 def barplot(data):
     """
-    take in a dataframe
-    draw line plots and save the fiugre as barplots.png
+    take in the aggregate cube
+    return the trip count of every year and season
+    and of every year and period
+    """
+    return (cube.rollup(data, ["year", "Season"]),
+            cube.rollup(data, ["year", "Period"]))
+
+
+def draw_barplot(tripcount_season, tripcount_period):
+    """
+    take in the tables of barplot
+    draw bar plots and return the figure
     """
-    sample = data
-    sns.set_style('darkgrid', {"xtick.major.size": 20, "ytick.major.size": 20})
-    plt.tight_layout()
-    with sns.plotting_context(rc={"legend.fontsize": 17}):
+    with sns.axes_style("darkgrid", STYLE), \
+            sns.plotting_context(rc={"legend.fontsize": 17}):
         barfig, ax = plt.subplots(ncols=2, figsize=(14, 6))
         # plot the trip count of different seaons in each year
-        sample["count"] = 1
-        tripcount_season = sample.groupby(["year", "Season"])["count"].sum()
         sns.barplot(x="year", y="count", hue="Season",
-                    data=tripcount_season.reset_index(), ax=ax[0])
+                    data=tripcount_season, ax=ax[0])
         ax[0].legend(loc='upper left', bbox_to_anchor=(1.04, 1))
 
         ax[1].set_xlabel("year", fontsize=18)
         ax[1].set_ylabel("trip count", fontsize=18)
 
         # plot the trip count of different period in each year
-        tripcount_period = sample.groupby(["year", "Period"])["count"].sum()
         sns.barplot(x="year", y="count", hue="Period",
-                    data=tripcount_period.reset_index(), ax=ax[1])
+                    data=tripcount_period, ax=ax[1])
         ax[1].legend(loc='upper left', bbox_to_anchor=(1.04, 1))
 
         ax[1].set_xlabel("year", fontsize=18)
         ax[1].set_ylabel("trip count", fontsize=18)
 
         barfig.tight_layout()
-        barfig.savefig("barplots.png")
+    return barfig
 
 
+@instrument.stage
 def freqplot(data):
     """
-    take in a dataframe
-    draw line plots and save the fiugre as freqplots.png
+    take in the aggregate cube
+    return the trip count of every year and month
     """
-    sample = data
-    sns.set_style('darkgrid', {"xtick.major.size": 20, "ytick.major.size": 20})
-    plt.tight_layout()
-    with sns.plotting_context(rc={"legend.fontsize": 17}):
-        freqfig, ax = plt.subplots(1, figsize=(8, 6))
-        sample["count"] = 1
-        sample = sample.groupby(["year", "month"])["count"].sum()
-        years2 = sample.reset_index()
+    return (cube.rollup(data, ["year", "month"]),)
+
 
+def draw_freqplot(years2):
+    """
+    take in the table of freqplot
+    draw line plots and return the figure
+    """
+    with sns.axes_style("darkgrid", STYLE), \
+            sns.plotting_context(rc={"legend.fontsize": 17}):
+        freqfig, ax = plt.subplots(1, figsize=(8, 6))
         sns.lineplot(x="month", y="count", hue="year", data=years2, ax=ax)
-        freqfig.savefig("freqplots.png")
+    return freqfig
 
 
 if __name__ == '__main__':
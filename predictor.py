@@ -0,0 +1,376 @@
+"""
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+Trains the end station decision tree of ml_model once and saves it
+as a versioned model (the tree, its feature vocabulary, the end
+station names and metadata), then scores batches of trips with it:
+for every trip, the k most likely end stations and their
+probabilities. The scoring is also served over http, and its
+throughput and latency can be benchmarked.
+
+    python predictor.py train
+    python predictor.py serve 8163
+    python predictor.py bench
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.tree import DecisionTreeClassifier
+
+import dataset
+import features
+import get_data
+import instrument
+import trip_store
+
+MODEL_DIR = sys.path[0] + '/models/end_station'
+# Columns of a trip to score: the start station, the start time
+# and the rider
+TRIP_COLUMNS = ['startstationid', 'starttime', 'usertype', 'gender',
+                'birthyear']
+PORT = 8163
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+
+
+def trip_features(trips):
+    """
+    Returns the model features of the trips as a dict of arrays,
+    derived the same way the cleaning derives them, without
+    dropping any trip. Trips missing a column cannot be scored and
+    raise a ValueError.
+
+    @param trips | dataframe (or dict of lists) of TRIP_COLUMNS.
+    """
+    values = {column: np.asarray(trips[column]) for column in TRIP_COLUMNS}
+    missing = [column for column in TRIP_COLUMNS
+               if pd.isna(values[column]).any()]
+    if len(missing) > 0:
+        raise ValueError('Trips with missing ' + ', '.join(missing))
+    start = trip_store.parse_starttime(pd.Series(values['starttime']))\
+        .to_numpy(dtype='datetime64[s]')
+    hour = start.astype('datetime64[h]').astype('int64') % 24
+    month = start.astype('datetime64[M]').astype('int64') % 12 + 1
+    year = start.astype('datetime64[Y]').astype('int64') + 1970
+    return {
+        'Season': np.asarray(get_data.SEASONS)[
+            get_data.MONTH_SEASON[month - 1]],
+        'month': month,
+        'Peak': np.asarray(get_data.PEAKS)[get_data.HOUR_PEAK[hour]],
+        'gender': values['gender'].astype('int64'),
+        'Period': np.asarray(get_data.PERIODS)[get_data.HOUR_PERIOD[hour]],
+        'age': year - values['birthyear'].astype('int64'),
+        'usertype': values['usertype'],
+        'startstationid': values['startstationid'].astype('int64')}
+
+
+@instrument.stage
+def train(filtered_data, max_depth=20, cache_dir=None):
+    """
+    Fits the end station decision tree on the shared train split
+    and returns the predictor: the tree, the vocabulary, the end
+    station names and the metadata of the model.
+
+    @param filtered_data | filtered Citi Bike trip data.
+    @param max_depth     | max depth of the tree.
+    @param cache_dir     | directory of the cached splits, defaults
+                           to dataset.CACHE_DIR.
+    """
+    split = dataset.load_split(filtered_data, cache_dir=cache_dir)
+    model = DecisionTreeClassifier(max_depth=max_depth,
+                                   random_state=dataset.SEED)
+    start = time.perf_counter()
+    model.fit(split['X_train'], split['y_train'])
+    meta = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sklearn': sklearn.__version__,
+            'split': os.path.basename(split['path']),
+            'max_depth': max_depth, 'fit_seconds':
+                time.perf_counter() - start,
+            'train_rows': int(split['X_train'].shape[0]),
+            'test_accuracy': float(model.score(split['X_test'],
+                                               split['y_test']))}
+    return {'model': model, 'vocabulary': split['vocabulary'],
+            'classes': split['classes'], 'meta': meta}
+
+
+def versions(model_dir=None):
+    """
+    Returns the sorted version numbers of the saved models.
+
+    @param model_dir | directory of the models, defaults to
+                       MODEL_DIR.
+    """
+    model_dir = model_dir or MODEL_DIR
+    if not os.path.exists(model_dir):
+        return []
+    return sorted(int(name[1:]) for name in os.listdir(model_dir)
+                  if name.startswith('v') and name[1:].isdigit())
+
+
+def save(predictor, model_dir=None):
+    """
+    Saves the predictor as the next version and returns the
+    version number.
+
+    @param predictor | the predictor, see train.
+    @param model_dir | directory of the models, defaults to
+                       MODEL_DIR.
+    """
+    model_dir = model_dir or MODEL_DIR
+    version = (versions(model_dir) or [0])[-1] + 1
+    partial = os.path.join(model_dir, 'v%d.partial' % version)
+    os.makedirs(partial)
+    with open(os.path.join(partial, 'model.pkl'), 'wb') as f:
+        pickle.dump(predictor['model'], f, protocol=pickle.HIGHEST_PROTOCOL)
+    features.save_vocabulary(predictor['vocabulary'],
+                             os.path.join(partial, 'vocabulary.json'))
+    meta = dict(predictor['meta'], version=version,
+                classes=predictor['classes'])
+    with open(os.path.join(partial, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(partial, os.path.join(model_dir, 'v%d' % version))
+    return version
+
+
+def load(version=None, model_dir=None):
+    """
+    Returns the saved predictor of the version, defaults to the
+    latest one.
+
+    @param version   | version number of the model.
+    @param model_dir | directory of the models, defaults to
+                       MODEL_DIR.
+    """
+    model_dir = model_dir or MODEL_DIR
+    if version is None:
+        if len(versions(model_dir)) == 0:
+            raise FileNotFoundError('No model saved in ' + model_dir)
+        version = versions(model_dir)[-1]
+    path = os.path.join(model_dir, 'v%d' % version)
+    with open(os.path.join(path, 'model.pkl'), 'rb') as f:
+        model = pickle.load(f)
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    return {'model': model, 'classes': meta.pop('classes'),
+            'vocabulary': features.load_vocabulary(
+                os.path.join(path, 'vocabulary.json')), 'meta': meta}
+
+
+def top_k(predictor, trips, k=5):
+    """
+    Returns the k most likely end stations of every trip and their
+    probabilities, as two arrays of shape (trips, k) sorted from
+    the most likely. A k below 1 raises a ValueError.
+
+    @param predictor | the predictor, see train.
+    @param trips     | dataframe (or dict of lists) of TRIP_COLUMNS.
+    @param k         | number of end stations per trip.
+    """
+    if k < 1:
+        raise ValueError('k must be at least 1, not %d' % k)
+    if 'indexes' not in predictor:
+        predictor['indexes'] = features.category_indexes(
+            predictor['vocabulary'])
+    X = features.encode(trip_features(trips), predictor['vocabulary'],
+                        predictor['indexes'])
+    model = predictor['model']
+    proba = model.predict_proba(X)
+    k = min(k, proba.shape[1])
+    best = np.argpartition(-proba, k - 1, axis=1)[:, :k]
+    best_proba = np.take_along_axis(proba, best, axis=1)
+    order = np.argsort(-best_proba, axis=1, kind='stable')
+    best = np.take_along_axis(best, order, axis=1)
+    names = np.asarray(predictor['classes'])[model.classes_[best]]
+    return names, np.take_along_axis(best_proba, order, axis=1)
+
+
+def score(predictor, trips, k=5):
+    """
+    Returns the k most likely end stations of every trip as a long
+    dataframe with the position of the trip, the rank, the end
+    station name and the probability.
+
+    @param predictor | the predictor, see train.
+    @param trips     | dataframe (or dict of lists) of TRIP_COLUMNS.
+    @param k         | number of end stations per trip.
+    """
+    names, proba = top_k(predictor, trips, k)
+    n, k = names.shape
+    return pd.DataFrame({'trip': np.repeat(np.arange(n), k),
+                         'rank': np.tile(np.arange(1, k + 1), n),
+                         'endstationname': names.ravel(),
+                         'probability': proba.ravel()})
+
+
+def make_server(predictor, host='127.0.0.1', port=PORT):
+    """
+    Returns an http server scoring trips with the predictor.
+
+    POST /predict with {"trips": {column: [values]} or [{column:
+    value}, ...], "k": 5} answers {"version": ..., "predictions":
+    [[{"endstationname": ..., "probability": ...}, ...], ...]}, one
+    list per trip. Invalid trips or a k below 1 answer 400.
+    GET /health answers the metadata of the model.
+
+    @param predictor | the predictor, see train.
+    @param host      | address to listen on.
+    @param port      | port to listen on, 0 for any free port.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != '/health':
+                self.send_json(404, {'error': 'not found'})
+                return
+            self.send_json(200, predictor['meta'])
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self.send_json(404, {'error': 'not found'})
+                return
+            try:
+                request = json.loads(self.rfile.read(
+                    int(self.headers.get('Content-Length', 0))))
+                trips = request['trips']
+                if isinstance(trips, list):
+                    trips = pd.DataFrame(trips)
+                names, proba = top_k(predictor, trips,
+                                     int(request.get('k', 5)))
+            except (ValueError, KeyError, TypeError) as error:
+                self.send_json(400, {'error': repr(error)})
+                return
+            self.send_json(200, {
+                'version': predictor['meta'].get('version'),
+                'predictions': [
+                    [{'endstationname': name, 'probability': float(p)}
+                     for name, p in zip(row_names, row_proba)]
+                    for row_names, row_proba in zip(names.tolist(), proba)]})
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def post_trips(url, trips, k=5):
+    """
+    Returns the answer of the http server to the trips.
+
+    @param url   | base url of the server.
+    @param trips | dict of lists (or list of dicts) of
+                   TRIP_COLUMNS.
+    @param k     | number of end stations per trip.
+    """
+    request = Request(url + '/predict', json.dumps(
+        {'trips': trips, 'k': k}).encode(),
+        {'Content-Type': 'application/json'})
+    with urlopen(request) as response:
+        return json.load(response)
+
+
+def latency_report(name, batch_size, seconds):
+    """
+    Returns the throughput and latency percentiles of the timed
+    calls of one batch size.
+
+    @param name       | name of the benchmarked path.
+    @param batch_size | number of trips per call.
+    @param seconds    | list of seconds of every call.
+    """
+    seconds = np.asarray(seconds)
+    return {'path': name, 'batch_size': batch_size, 'calls': len(seconds),
+            'trips_per_sec': batch_size * len(seconds) / seconds.sum(),
+            'p50_ms': np.percentile(seconds, 50) * 1000,
+            'p99_ms': np.percentile(seconds, 99) * 1000}
+
+
+def benchmark(predictor, trips, batch_sizes=BATCH_SIZES, calls=200, k=5):
+    """
+    Returns a dataframe of the throughput and p50/p99 latency of
+    scoring batches of trips, in process and over http, at every
+    batch size.
+
+    @param predictor   | the predictor, see train.
+    @param trips       | dataframe of TRIP_COLUMNS to draw batches
+                         from.
+    @param batch_sizes | list of numbers of trips per call.
+    @param calls       | number of timed calls per batch size (fewer
+                         for large batches).
+    @param k           | number of end stations per trip.
+    """
+    server = make_server(predictor, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d' % server.server_address[1]
+    rows = []
+    try:
+        for batch_size in batch_sizes:
+            batch = trips.sample(batch_size, replace=True, random_state=1)
+            payload = {column: batch[column].astype(str).tolist()
+                       if column == 'starttime' else batch[column].tolist()
+                       for column in TRIP_COLUMNS}
+            repeat = max(5, min(calls, 100000 // batch_size))
+            for name, call in [
+                    ('in process', lambda: top_k(predictor, batch, k)),
+                    ('http', lambda: post_trips(url, payload, k))]:
+                call()
+                seconds = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    call()
+                    seconds.append(time.perf_counter() - start)
+                rows.append(latency_report(name, batch_size, seconds))
+    finally:
+        server.shutdown()
+        server.server_close()
+    return pd.DataFrame(rows)
+
+
+def main():
+    """
+    Trains and saves a new version of the model, serves the latest
+    version over http, or benchmarks its scoring on the cleaned
+    trips.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('command', choices=['train', 'serve', 'bench'])
+    parser.add_argument('port', nargs='?', type=int, default=PORT)
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        import ml_model
+
+        version = save(train(ml_model.filter_data(ml_model.load_data())))
+        print('Saved end station model v%d to %s' % (version, MODEL_DIR))
+        instrument.write_report()
+    elif args.command == 'serve':
+        predictor = load()
+        server = make_server(predictor, port=args.port)
+        print('Serving end station model v%d on http://127.0.0.1:%d'
+              % (predictor['meta']['version'], args.port))
+        server.serve_forever()
+    else:
+        trips = trip_store.load_trips(TRIP_COLUMNS)
+        print(benchmark(load(), trips).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+'''
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+This Program computes distances between bike stations and transit
+stations in metres, projecting both layers once to the New Jersey
+state plane and working on plain coordinate arrays.
+'''
+import sys
+import pickle
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+# NAD83 / New Jersey, in metres
+NJ_CRS = 'EPSG:32111'
+INDEX_PATH = sys.path[0] + '/station_index.pkl'
+TRANSIT_PATH = sys.path[0] + '/jersey-city-public-transit.geojson'
+
+
+def project(gdf):
+    '''
+    Return the x and y coordinates of the points in metres
+
+    Project the point geodataframe to the New Jersey state plane.
+    '''
+    projected = gdf.geometry.to_crs(NJ_CRS)
+    return np.column_stack([projected.x.to_numpy(), projected.y.to_numpy()])
+
+
+def distance_matrix(xy_from, xy_to):
+    '''
+    Return the matrix of euclidean distances between two sets of
+    projected points, one row per point of xy_from
+    '''
+    dx = xy_from[:, 0, np.newaxis] - xy_to[np.newaxis, :, 0]
+    dy = xy_from[:, 1, np.newaxis] - xy_to[np.newaxis, :, 1]
+    return np.hypot(dx, dy)
+
+
+def pairs_within(distances, radius):
+    '''
+    Return the row index, column index and distance of every pair
+    of the distance matrix that is within the radius
+    '''
+    rows, columns = np.nonzero(distances <= radius)
+    return rows, columns, distances[rows, columns]
+
+
+def bike_transit_pairs(bike_stations, transit, radius):
+    '''
+    Return a dataframe with one line per bike station and transit
+    station within the radius (in metres) of each other
+
+    The columns are the ones the trip allocation uses:
+    'index' (bike station id), 'station_name', 'distance',
+    'trip count' and 'tripduration', plus 'public_transit_type'
+    when the transit stations have it.
+    '''
+    distances = distance_matrix(project(bike_stations), project(transit))
+    rows, columns, distance = pairs_within(distances, radius)
+    pairs = pd.DataFrame({
+        'index': bike_stations.index.to_numpy()[rows],
+        'station_name': transit['station_name'].to_numpy()[columns],
+        'distance': distance,
+        'trip count': bike_stations['trip count'].to_numpy()[rows],
+        'tripduration': bike_stations['tripduration'].to_numpy()[rows]})
+    if 'public_transit_type' in transit.columns:
+        pairs['public_transit_type'] = \
+            transit['public_transit_type'].to_numpy()[columns]
+    return pairs
+
+
+def project_lonlat(lon, lat):
+    '''
+    Return the x and y coordinates in metres of longitude/latitude
+    arrays, in the New Jersey state plane
+    '''
+    transformer = Transformer.from_crs('EPSG:4326', NJ_CRS, always_xy=True)
+    x, y = transformer.transform(np.asarray(lon), np.asarray(lat))
+    return np.column_stack([x, y])
+
+
+def build_index(bike_stations, gdf_transit):
+    '''
+    Return a spatial index over the bike stations and all
+    the transit stations
+
+    The index is a dict holding the projected coordinates, the
+    station ids and names, and one KD-tree over every transit
+    station plus one per public transit type, so that queries for
+    a single type do not have to filter the results.
+    It can be saved with save_index and reused for any radius.
+    '''
+    transit_xy = project(gdf_transit)
+    types = gdf_transit['public_transit_type'].to_numpy()
+    trees = {None: (cKDTree(transit_xy), np.arange(len(types)))}
+    for transit_type in np.unique(types):
+        rows = np.flatnonzero(types == transit_type)
+        trees[transit_type] = (cKDTree(transit_xy[rows]), rows)
+    return {
+        'bike_ids': pd.Index(bike_stations.index),
+        'bike_xy': project(bike_stations),
+        'transit_names': gdf_transit['station_name'].to_numpy(),
+        'transit_types': types,
+        'transit_trees': trees}
+
+
+def save_index(index, path=INDEX_PATH):
+    '''
+    Save the spatial index to disk
+    '''
+    with open(path, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_index(path=INDEX_PATH):
+    '''
+    Return the spatial index saved on disk
+    '''
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def transit_result(index, rows, distances):
+    '''
+    Return a dataframe of transit stations, sorted by distance
+    '''
+    order = np.argsort(distances, kind='stable')
+    rows, distances = np.asarray(rows)[order], np.asarray(distances)[order]
+    return pd.DataFrame({
+        'station_name': index['transit_names'][rows],
+        'public_transit_type': index['transit_types'][rows],
+        'distance': distances})
+
+
+def transit_within(index, bike_id, radius, transit_type=None):
+    '''
+    Return the transit stations within the radius (in metres) of
+    the bike station, optionally of one public transit type only,
+    sorted by distance
+    '''
+    tree, tree_rows = index['transit_trees'][transit_type]
+    xy = index['bike_xy'][index['bike_ids'].get_loc(bike_id)]
+    found = tree.query_ball_point(xy, radius)
+    distances = np.hypot(*(tree.data[found] - xy).T)
+    return transit_result(index, tree_rows[found], distances)
+
+
+def nearest_transit(index, bike_id, k=1, transit_type=None):
+    '''
+    Return the k transit stations nearest to the bike station,
+    optionally of one public transit type only
+
+    A k below 1 raises a ValueError.
+    '''
+    if k < 1:
+        raise ValueError('k must be at least 1, not %d' % k)
+    tree, tree_rows = index['transit_trees'][transit_type]
+    k = min(k, tree.n)
+    xy = index['bike_xy'][index['bike_ids'].get_loc(bike_id)]
+    distances, found = tree.query(xy, k=[i + 1 for i in range(k)])
+    return transit_result(index, tree_rows[found], distances)
+
+
+def points_within(index, lon, lat, radius, transit_type=None):
+    '''
+    Return every (point, transit station) pair within the radius,
+    for arrays of longitude/latitude points, as a dataframe with
+    the position of the point in the 'point' column
+    '''
+    tree, tree_rows = index['transit_trees'][transit_type]
+    points = project_lonlat(lon, lat)
+    pairs = cKDTree(points).sparse_distance_matrix(
+        tree, radius, output_type='coo_matrix')
+    result = transit_result(index, tree_rows[pairs.col], pairs.data)
+    result.insert(0, 'point', pairs.row[np.argsort(pairs.data,
+                                                   kind='stable')])
+    return result.sort_values(['point', 'distance'], ignore_index=True)
+
+
+def main():
+    '''
+    Build the spatial index over every station of the station table
+    and every transit station, and save it to disk
+    '''
+    import stations
+
+    table = stations.read_stations()
+    bike_stations = gpd.GeoDataFrame(
+        table[['name']], geometry=gpd.points_from_xy(
+            table['longitude'], table['latitude']), crs='EPSG:4326')
+    index = build_index(bike_stations, gpd.read_file(TRANSIT_PATH))
+    save_index(index)
+    print('Saved spatial index of %d bike stations to %s'
+          % (len(bike_stations), INDEX_PATH))
+
+
+if __name__ == '__main__':
+    main()
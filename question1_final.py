@@ -6,33 +6,70 @@ Date: 03/13/2020
 
 This Program address the spatial analysis question in final project
 '''
+import sys
+
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+from scipy import sparse
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-
-def get_bike_stations(df_trip):
+import basemap
+import instrument
+import proximity
+import render
+import stations
+import trip_store
+
+STATION_COLUMNS = ['startstationid', 'tripduration']
+# Catchment radius of a transit station in metres (0.5 mile)
+RADIUS = 800
+# Radii of the sweep mode, 200 m to 2 km
+SWEEP_RADII = list(range(200, 2001, 200))
+# Time slices of the slices mode
+SLICE_KEYS = ['year', 'Season', 'Peak']
+# Size of the station distribution map, in inches
+MAP_FIGSIZE = (20, 15)
+
+
+@instrument.stage
+def get_bike_stations(df_trip, station_table=None):
     '''
     Return grouped bike station data
 
-    Transfrom the bike dataframe to geodataframe
-    Add extra column "count" for following dissolve
-    Set coordinate reference system, same as bike dataframe.
+    Sum the trip duration and count the trips of each station
+    with a plain groupby, keeping the first coordinates.
+    Trips that only have station ids take the coordinates
+    from the station table instead.
+    Only then build one point per station (a few hundred points
+    instead of one per trip) and set coordinate reference system,
+    same as bike dataframe.
     '''
-    gdf_trip = gpd.GeoDataFrame(
-        df_trip, geometry=gpd.points_from_xy(
-            df_trip['startstationlongitude'], df_trip['startstationlatitude']))
-    gdf_trip.loc[:, 'trip count'] = 1
-
-    bike_stations = gdf_trip[
-        ['tripduration', 'startstationid', 'geometry', 'trip count']]
-    bike_stations = bike_stations.dissolve(by='startstationid', aggfunc='sum')
-    bike_stations.crs = {'init': 'epsg:4326'}
+    columns = {'tripduration': ('tripduration', 'sum'),
+               'trip_count': ('tripduration', 'size')}
+    with_coordinates = 'startstationlatitude' in df_trip.columns
+    if with_coordinates:
+        columns['latitude'] = ('startstationlatitude', 'first')
+        columns['longitude'] = ('startstationlongitude', 'first')
+    bike_totals = df_trip.groupby('startstationid').agg(**columns)
+    if not with_coordinates:
+        if station_table is None:
+            station_table = stations.read_stations()
+        bike_totals = bike_totals.join(stations.station_coordinates(
+            bike_totals.index.to_series(), station_table))
+
+    bike_stations = gpd.GeoDataFrame(
+        {'tripduration': bike_totals['tripduration'].astype('int64'),
+         'trip count': bike_totals['trip_count']},
+        geometry=gpd.points_from_xy(
+            bike_totals['longitude'], bike_totals['latitude']),
+        index=bike_totals.index, crs='EPSG:4326')
 
     return bike_stations
 
 
+@instrument.stage
 def filter_transit(gdf_transit):
     '''
     Return filtered transit station data
@@ -45,141 +82,163 @@ def filter_transit(gdf_transit):
     return filtered_gdf_transit
 
 
-def create_transit_buffer(filtered_gdf_transit):
+@instrument.stage
+def bike_transit_pairs(bike_stations, filtered_gdf_transit, radius=RADIUS):
     '''
-    Return a transit buffer dataframe with polygon geometry
-
-    Create buffer for transit station.
-    When New Jersey Coordinate: 40.0583° N, 74.4057° W,
-    it means, 1 decimal degree change indicates about 80 km change.
-    So a 0.5 mile = 0.8 km buffer is about 0.01.
-    Set coordinate reference system, same as bike dataframe
+    Return a dataframe with one line per link (bike station to
+    transit station) within the radius, in metres
+
+    Both layers are projected once to the New Jersey state plane,
+    the full bike station x transit station distance matrix is
+    computed with NumPy, and the links are the pairs within
+    the radius. This replaces buffering in degrees, the two
+    spatial joins and the merge.
     '''
-    transit_buffer = filtered_gdf_transit[['station_name', 'geometry']]
-    transit_buffer.loc[:, 'geometry'] = transit_buffer.loc[
-        :, 'geometry'].buffer(0.01)
-    transit_buffer.crs = {'init': 'epsg:4326'}
+    return proximity.bike_transit_pairs(
+        bike_stations, filtered_gdf_transit, radius)
 
-    return transit_buffer
 
-
-def filter_transit_buffer(transit_buffer, bike_stations):
-    '''
-    Return a modified transit buffer dataframe
-
-    Filter transit stations that do not cover any bike stations
+@instrument.stage
+def filter_bike_stations(bike_stations, bike_transit):
     '''
-    mod_transit_buffer = gpd.sjoin(
-        transit_buffer,
-        bike_stations,
-        how='inner',
-        op='intersects')
-
-    return mod_transit_buffer
-
-
-def filter_bike_stations(transit_buffer, bike_stations):
-    '''
-    Return a modified transit buffer dataframe
+    Return a modified bike station dataframe
 
     Filter bikes stations that are not within any transit station
     '''
-    bike_within_transit = gpd.sjoin(
-        bike_stations,
-        transit_buffer,
-        how='inner',
-        op='within')
+    bike_within_transit = bike_stations.loc[
+        bike_stations.index.isin(bike_transit['index']), :]
 
     return bike_within_transit
 
 
-def merge_bike_and_transit(bike_within_transit, filtered_gdf_transit):
+@instrument.stage
+def create_transit_buffer(filtered_gdf_transit, bike_transit, radius=RADIUS):
     '''
-    Return a dataframe that merge bike and transit station dataframes
+    Return a transit buffer dataframe with polygon geometry
 
-    The merged dataframes are the two proccessed dataframe, only included
-    neccessary links (bike station to transit station)
+    Create buffer for transit stations that cover any bike station,
+    only for plotting. The buffer is drawn in metres in the
+    New Jersey state plane, then set back to the coordinate
+    reference system of the bike dataframe.
     '''
-    bike_copy = bike_within_transit.reset_index()
-    transit_copy = filtered_gdf_transit[['station_name', 'geometry']]
-    bike_transit = transit_copy.merge(
-        bike_copy,
-        left_on='station_name',
-        right_on='station_name',
-        how='right')
+    covering = filtered_gdf_transit.loc[
+        filtered_gdf_transit['station_name'].isin(
+            bike_transit['station_name']), ['station_name', 'geometry']]
+    transit_buffer = covering.to_crs(proximity.NJ_CRS)
+    transit_buffer['geometry'] = transit_buffer.buffer(radius)
 
-    return bike_transit
+    return transit_buffer.to_crs('EPSG:4326')
 
 
-def bike_to_transit_distance(bike_transit):
+@instrument.stage
+def distribute_trips(bike_transit):
     '''
-    Return a dataframe with distance calculated
+    Return a dataframe with distributed trip and trip duration
 
-    Create two dataframes for targeted bike stations'
-    and transit stations' locationsC
-    Calculate distance from bike station
-    to transit station for each line
+    Calculate the proportion of the distance and acorrding this
+    ratio to distribute total trip counts and total trip duration.
     '''
-    bike_location = bike_transit[['index', 'geometry_x']]
-    bike_location = gpd.GeoDataFrame(bike_location, geometry='geometry_x')
-    transit_location = bike_transit[['station_name', 'geometry_y']]
-    transit_location = gpd.GeoDataFrame(
-        transit_location, geometry='geometry_y')
-    bike_transit.loc[:, 'distance'] = bike_location.distance(transit_location)
+    bike_codes, bike_ids = pd.factorize(bike_transit['index'])
+    allocation, station_names = allocation_matrix(bike_transit, bike_ids)
+    trip_count = np.zeros(len(bike_ids))
+    trip_count[bike_codes] = bike_transit['trip count'].to_numpy()
+    tripduration = np.zeros(len(bike_ids))
+    tripduration[bike_codes] = bike_transit['tripduration'].to_numpy()
+
+    bike_trip_conclusion = pd.DataFrame({
+        'station_name': station_names,
+        'trip_allocate': allocation @ trip_count,
+        'tripduration_allocate': allocation @ tripduration})
 
-    return bike_transit
+    return bike_trip_conclusion
 
 
-def distribute_trips(bike_transit):
+def allocation_matrix(bike_transit, bike_ids):
     '''
-    Return a dataframe with distributed trip and trip duration
+    Return the sparse allocation matrix of the links and
+    the names of its transit stations
 
-    Calculate the proportion of the distance and acorrding this
-    ratio to distribute total trip counts and total trip duration.
+    The matrix has one row per transit station and one column per
+    bike station id of bike_ids, holding the share of the bike
+    station's trips that goes to the transit station.
     '''
     # Calculate the proportion of the distance
     # and acorrding this ratio to distribute trip counts.
     # So we sum the distance by bike station,
     # which includes all distance to all accessible transit stations
     # Distance ratio indicate the trip counts allocation
-    total_dist = bike_transit.groupby('index')['distance'].sum()
-    total_dist = total_dist.reset_index()
-
-    distribute = bike_transit.merge(
-        total_dist, left_on='index', right_on='index', how='left')
-    distribute = distribute.drop(['index_right'], axis=1)
-    distribute.loc[:, 'distance_ratio'] = \
-        distribute['distance_x'] / distribute['distance_y']
-    distribute.loc[:, 'trip_allocate'] = \
-        distribute['trip count'] * distribute['distance_ratio']
-    distribute.loc[:, 'tripduration_allocate'] = \
-        distribute['tripduration'] * distribute['distance_ratio']
-
-    trip_allocate = distribute.groupby(
-        'station_name')['trip_allocate'].sum()
-    tripduration_allocate = distribute.groupby(
-        'station_name')['tripduration_allocate'].sum()
-    bike_trip_conclusion = pd.concat(
-        [trip_allocate, tripduration_allocate], axis=1).reset_index()
+    bike_codes = pd.Index(bike_ids).get_indexer(bike_transit['index'])
+    station_codes, station_names = pd.factorize(
+        bike_transit['station_name'], sort=True)
+    distance = bike_transit['distance'].to_numpy(dtype='float64')
+    total_dist = np.bincount(bike_codes, weights=distance,
+                             minlength=len(bike_ids))
+    distance_ratio = distance / total_dist[bike_codes]
 
-    return bike_trip_conclusion
+    # One row per transit station, one column per bike station,
+    # so that the allocation is a single matrix-vector product
+    allocation = sparse.csr_matrix(
+        (distance_ratio, (station_codes, bike_codes)),
+        shape=(len(station_names), len(bike_ids)))
+
+    return allocation, station_names
 
 
+@instrument.stage
+def sliced_allocation(df_trip, bike_transit, keys):
+    '''
+    Return a long dataframe with the trips and trip duration
+    allocated to each transit station, for every slice of the trips
+    by the grouping keys (e.g. ['year', 'Season', 'Peak'])
+
+    The trips are counted once per slice and bike station,
+    and one product with the allocation matrix allocates every slice
+    at once. '% trip' and '% tripduration' are within each slice.
+    '''
+    totals = df_trip.groupby(keys + ['startstationid'], observed=True)[
+        'tripduration'].agg(['size', 'sum'])
+    bike_ids = totals.index.get_level_values('startstationid').unique()
+    allocation, station_names = allocation_matrix(
+        bike_transit.loc[bike_transit['index'].isin(bike_ids)], bike_ids)
+    outside = ~bike_ids.isin(bike_transit['index'])
+
+    columns = {}
+    for name, column in [('trip_allocate', 'size'),
+                         ('tripduration_allocate', 'sum')]:
+        # one row per slice, one column per bike station
+        slices = totals[column].unstack('startstationid', fill_value=0)
+        slices = slices.reindex(columns=bike_ids, fill_value=0)
+        allocated = pd.DataFrame(
+            (allocation @ slices.to_numpy().T).T,
+            index=slices.index, columns=station_names)
+        allocated['Not within any station'] = \
+            slices.to_numpy()[:, outside].sum(axis=1)
+        columns[name] = allocated.stack()
+    sliced = pd.DataFrame(columns)
+    sliced.index.names = keys + ['station_name']
+    sliced = sliced.loc[(sliced != 0).any(axis=1)].reset_index()
+
+    groups = sliced.groupby(keys, observed=True)
+    sliced['% trip'] = sliced['trip_allocate'] / \
+        groups['trip_allocate'].transform('sum')
+    sliced['% tripduration'] = sliced['tripduration_allocate'] / \
+        groups['tripduration_allocate'].transform('sum')
+    return sliced.sort_values(keys + ['% trip'], ascending=[True] * len(
+        keys) + [False], ignore_index=True)
+
+
+@instrument.stage
 def bike_outside_transit(bike_stations, bike_within_transit):
     '''
     Return a Seires with information about the bike stations
     that are not near any transit station
 
-    Store all station id not within transit buffer in a set.
-    Locate all the data with these id and sum their trip information.
+    Mask the bike stations whose id is not within any transit buffer
+    and sum their trip information.
     Transform these values: name, trip count, trip duration to a series.
     '''
-    bike_outside_transit = set()
-    for station in set(bike_stations.reset_index()['startstationid']):
-        if station not in set(bike_within_transit.reset_index()['index']):
-            bike_outside_transit.add(station)
-    other = bike_stations.reset_index()
-    other = other.loc[other['startstationid'].isin(bike_outside_transit), :]
+    outside = ~bike_stations.index.isin(bike_within_transit.index)
+    other = bike_stations.loc[outside, :]
     other_trip = other['trip count'].sum()
     other_tripduration = other['tripduration'].sum()
     other_row = pd.Series(
@@ -190,6 +249,7 @@ def bike_outside_transit(bike_stations, bike_within_transit):
     return other_row
 
 
+@instrument.stage
 def conclude_data(bike_trip_conclusion, other_row):
     '''
     Return a dataframe that consist all results
@@ -199,8 +259,9 @@ def conclude_data(bike_trip_conclusion, other_row):
     calculate the % of trip and trip duration.
     Then sort value by descending.
     '''
-    bike_trip_conclusion = bike_trip_conclusion.append(
-        other_row, ignore_index=True)
+    bike_trip_conclusion = pd.concat(
+        [bike_trip_conclusion, other_row.to_frame().T.infer_objects()],
+        ignore_index=True)
     bike_trip_conclusion.loc[:, '% trip'] = \
         bike_trip_conclusion['trip_allocate'] / \
         bike_trip_conclusion['trip_allocate'].sum()
@@ -213,69 +274,81 @@ def conclude_data(bike_trip_conclusion, other_row):
     return bike_trip_conclusion
 
 
+@instrument.stage
+def conclusion_buffer(mod_transit_buffer, bike_trip_conclusion):
+    '''
+    Return the transit buffer geodataframe with the % trip
+    information of the concluded table
+    '''
+    conlusion_transit = mod_transit_buffer.drop_duplicates('station_name')
+    return conlusion_transit.merge(
+        bike_trip_conclusion,
+        left_on='station_name',
+        right_on='station_name',
+        how='inner')
+
+
 def sptial_plot(
-        mod_transit_buffer,
+        conclusion_buffer,
         gdf_jersey, bike_stations,
-        bike_within_transit,
-        bike_trip_conclusion):
+        bike_within_transit):
     '''
-    Save a figure that represent the spatial distribution of bikes
+    Return a figure that represent the spatial distribution of bikes
     and frequency of bike usage near transit stations.
 
-    Add % trip information to the transit buffer geodataframe.
     Jersey city parcel is the bottom layer.
     Transit station buffer is second layer with transparancy.
     All bike stations is third layer.
     Bike station within transit station is top layer.
     '''
-    conlusion_transit = mod_transit_buffer.drop_duplicates('station_name')
-    conclusion_buffer = conlusion_transit.merge(
-        bike_trip_conclusion,
-        left_on='station_name',
-        right_on='station_name',
-        how='inner')
     with sns.plotting_context(rc={"legend.fontsize": 15}):
-        fig, ax = plt.subplots(1, figsize=(20, 15))
+        fig, ax = plt.subplots(1, figsize=MAP_FIGSIZE)
         gdf_jersey.plot(ax=ax, color='#AAAAAA')
         conclusion_buffer.plot(
             ax=ax, column='% trip', legend=True, alpha=0.3, edgecolor='black')
         bike_stations.plot(ax=ax, markersize=40)
         bike_within_transit.plot(ax=ax, color='#FF9923', markersize=40)
         fig.suptitle('station distribution plot', fontsize=30)
-        plt.xlabel('Longitude', fontsize=25)
-        plt.ylabel('Latitude', fontsize=25)
+        ax.set_xlabel('Longitude', fontsize=25)
+        ax.set_ylabel('Latitude', fontsize=25)
         ax.xaxis.label.set_size(20)
         ax.yaxis.label.set_size(20)
-
-        # may need to change the path
-        plt.savefig('station distribution plot.png')
+    return fig
 
 
-def pie_chart(bike_trip_conclusion):
+@instrument.stage
+def pie_chart_data(bike_trip_conclusion):
     '''
-    Save a figure that plot the % of bike counts for each transit station
+    Return the % of bike counts for each transit station
     (over total bike counts from 2015 - 2019)
 
     Filter the least representative data as other stations,
     sum the trip information for these station and append it back.
-    Draw the pie chart based on the calculated % bike trip distribution
-    among the transit stations.
     '''
     other_stations = bike_trip_conclusion.loc[
         bike_trip_conclusion['% trip'] < 0.01, :]
     pie_chart_conclusion = bike_trip_conclusion.loc[
         bike_trip_conclusion['% trip'] >= 0.01, :]
     if len(other_stations) > 0:
-        pie_chart_conclusion = pie_chart_conclusion.append({
+        pie_chart_conclusion = pd.concat([pie_chart_conclusion, pd.DataFrame([{
             'station_name': 'Other Stations',
             'trip_allocate': other_stations['trip_allocate'].sum(),
             'tripduration_allocate': other_stations[
                 'tripduration_allocate'].sum(),
             '% trip': other_stations['% trip'].sum(),
             '% tripduration': other_stations['% tripduration'].sum()
-            }, ignore_index=True)
-    sns.set_style('darkgrid', {"xtick.major.size": 10, "ytick.major.size": 10})
-    with sns.plotting_context(rc={"legend.fontsize": 15}):
+            }])], ignore_index=True)
+    return pie_chart_conclusion
+
+
+def pie_chart(pie_chart_conclusion):
+    '''
+    Return a figure with the pie chart of the calculated % bike trip
+    distribution among the transit stations.
+    '''
+    with sns.axes_style('darkgrid', {"xtick.major.size": 10,
+                                     "ytick.major.size": 10}), \
+            sns.plotting_context(rc={"legend.fontsize": 15}):
         fig, ax = plt.subplots(figsize=(30, 30))
         labels = pie_chart_conclusion['station_name']
         fracs = pie_chart_conclusion['% trip']
@@ -283,42 +356,149 @@ def pie_chart(bike_trip_conclusion):
             fracs, labels=labels,
             autopct='%1.1f%%',
             textprops={'fontsize': 40})
-        plt.title('Trip Counts in % By Transit Stations', fontsize=60)
-
-    # may need to change the path
-    plt.savefig('pie_chart.png')
+        ax.set_title('Trip Counts in % By Transit Stations', fontsize=60)
+    return fig
 
 
-def main():
+@instrument.stage
+def radius_sweep(bike_stations, gdf_transit, radii=SWEEP_RADII,
+                 transit_types=None):
     '''
-    This function first reads all the files needed
-    and run the above functions step by step.
-    Then, plot the graphs with concluded table.
+    Return a long dataframe with the concluded table of every
+    public transit type and radius (in metres)
+
+    The bike to transit distances are computed once for the
+    largest radius. Each link then belongs to every radius from
+    the first one that reaches it, so the distance sums of the
+    bike stations and the allocated trips of all radii come out
+    of one pass over a links x radii matrix, instead of rerunning
+    the pipeline for every radius and type.
+    '''
+    radii = np.sort(np.asarray(radii))
+    if transit_types is None:
+        transit_types = gdf_transit['public_transit_type'].unique()
+    transit = gdf_transit.loc[
+        gdf_transit['public_transit_type'].isin(transit_types), :]
+    pairs = proximity.bike_transit_pairs(bike_stations, transit, radii[-1])
+
+    # included[i, j]: link i is within radius j
+    first_radius = np.searchsorted(radii, pairs['distance'].to_numpy())
+    included = np.arange(len(radii)) >= first_radius[:, np.newaxis]
+    distance = pairs['distance'].to_numpy()[:, np.newaxis] * included
+    keys = [pairs['public_transit_type'], pairs['index']]
+    total_dist = pd.DataFrame(distance).groupby(keys).transform('sum')
+    ratio = np.divide(distance, total_dist.to_numpy(),
+                      out=np.zeros_like(distance), where=included)
+
+    tables = []
+    for name, column in [('trip_allocate', 'trip count'),
+                         ('tripduration_allocate', 'tripduration')]:
+        allocate = pd.DataFrame(
+            ratio * pairs[column].to_numpy()[:, np.newaxis], columns=radii)
+        allocate = allocate.groupby(
+            [pairs['public_transit_type'], pairs['station_name']]).sum()
+        allocate = allocate.loc[allocate.ne(0).any(axis=1)]
+        tables.append(allocate.stack().rename(name))
+    sweep = pd.concat(tables, axis=1)
+    sweep.index.names = ['public_transit_type', 'station_name', 'radius']
+    sweep = sweep.loc[sweep['trip_allocate'] > 0].reset_index()
+
+    # Bike stations without any link of the type within the radius
+    covered = pd.DataFrame(included).groupby(keys).any()
+    other = []
+    for transit_type in transit_types:
+        if transit_type in covered.index.get_level_values(0):
+            type_covered = covered.loc[transit_type].reindex(
+                bike_stations.index, fill_value=False).to_numpy()
+        else:
+            type_covered = np.zeros((len(bike_stations), len(radii)), bool)
+        outside = ~type_covered
+        other.append(pd.DataFrame({
+            'public_transit_type': transit_type,
+            'station_name': 'Not within any station',
+            'radius': radii,
+            'trip_allocate':
+                bike_stations['trip count'].to_numpy() @ outside,
+            'tripduration_allocate':
+                bike_stations['tripduration'].to_numpy() @ outside}))
+    sweep = pd.concat([sweep] + other, ignore_index=True)
+
+    groups = sweep.groupby(['public_transit_type', 'radius'])
+    sweep['% trip'] = sweep['trip_allocate'] / \
+        groups['trip_allocate'].transform('sum')
+    sweep['% tripduration'] = sweep['tripduration_allocate'] / \
+        groups['tripduration_allocate'].transform('sum')
+    return sweep.sort_values(
+        ['public_transit_type', 'radius', '% trip', '% tripduration'],
+        ascending=[True, True, False, False], ignore_index=True)
+
+
+def spatial_analysis(df_trip, gdf_transit, gdf_jersey, radius=RADIUS,
+                     fmt='png', dpi=render.DPI):
     '''
-    df_trip = pd.read_csv('filtered_bike_data.csv')
-    gdf_transit = gpd.read_file('jersey-city-public-transit.geojson')
-    gdf_jersey = gpd.read_file('jersey-city-parcels.geojson')
+    Return the concluded table of trips allocated to transit stations
 
+    Run the above functions step by step on the trip data,
+    transit stations and Jersey City parcels (or their basemap),
+    with the given catchment radius in metres.
+    Then, render the graphs with concluded table
+    in the given figure format and dpi.
+    '''
     bike_stations = get_bike_stations(df_trip)
     filtered_gdf_transit = filter_transit(gdf_transit)
-    transit_buffer = create_transit_buffer(filtered_gdf_transit)
-    mod_transit_buffer = filter_transit_buffer(transit_buffer, bike_stations)
-    bike_within_transit = filter_bike_stations(transit_buffer, bike_stations)
-    bike_transit = merge_bike_and_transit(
-        bike_within_transit, filtered_gdf_transit)
-    bike_transit = bike_to_transit_distance(bike_transit)
+    bike_transit = bike_transit_pairs(
+        bike_stations, filtered_gdf_transit, radius)
+    bike_within_transit = filter_bike_stations(bike_stations, bike_transit)
     bike_trip_conclusion = distribute_trips(bike_transit)
     other_row = bike_outside_transit(bike_stations, bike_within_transit)
     bike_trip_conclusion = conclude_data(bike_trip_conclusion, other_row)
 
-    sptial_plot(
-        mod_transit_buffer,
-        gdf_jersey,
-        bike_stations,
-        bike_within_transit,
-        bike_trip_conclusion)
+    mod_transit_buffer = create_transit_buffer(
+        filtered_gdf_transit, bike_transit, radius)
+
+    # may need to change the path
+    render.render_all([
+        (sptial_plot, (
+            conclusion_buffer(mod_transit_buffer, bike_trip_conclusion),
+            gdf_jersey,
+            bike_stations,
+            bike_within_transit), 'station distribution plot'),
+        (pie_chart, (pie_chart_data(bike_trip_conclusion),), 'pie_chart')],
+        fmt, dpi)
+
+    return bike_trip_conclusion
+
 
-    pie_chart(bike_trip_conclusion)
+def main():
+    '''
+    This function first reads all the files needed
+    and run the spatial analysis on them.
+    With the argument 'sweep', the analysis is run for every
+    radius and transit type instead and saved as radius_sweep.csv.
+    With the argument 'slices', it is run for every year, season
+    and peak and saved as sliced_allocation.csv.
+    '''
+    mode = sys.argv[1] if len(sys.argv) > 1 else None
+    with instrument.measure('question1_final.load') as record:
+        df_trip = trip_store.load_trips(
+            STATION_COLUMNS + (SLICE_KEYS if mode == 'slices' else []))
+        gdf_transit = gpd.read_file('jersey-city-public-transit.geojson')
+        record['rows_out'] = len(df_trip)
+
+    if mode == 'sweep':
+        sweep = radius_sweep(get_bike_stations(df_trip), gdf_transit)
+        sweep.to_csv('radius_sweep.csv', index=None, header=True)
+    elif mode == 'slices':
+        bike_transit = bike_transit_pairs(
+            get_bike_stations(df_trip), filter_transit(gdf_transit))
+        sliced = sliced_allocation(df_trip, bike_transit, SLICE_KEYS)
+        sliced.to_csv('sliced_allocation.csv', index=None, header=True)
+    else:
+        # the parcels are only a grey background,
+        # so their cached outline is drawn instead
+        gdf_jersey = basemap.load_basemap(width=MAP_FIGSIZE[0])
+        spatial_analysis(df_trip, gdf_transit, gdf_jersey)
+    instrument.write_report()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,85 @@
+"""
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+Renders the figures of the other classes in a pool of worker
+processes with the Agg backend. The analysis only computes the
+tables a figure needs and hands them over with the function that
+draws it, so the figures are drawn in parallel and the analysis
+process never creates any matplotlib figure.
+
+A draw function takes the tables as arguments and returns the
+figure, e.g.
+
+    render.render_all([(plot.draw_freqplot, (years,), 'freqplots')])
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import instrument
+
+FORMATS = ['png', 'svg']
+DPI = 100
+
+
+def init_worker():
+    """
+    Sets up a worker process to draw without a display.
+    """
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+
+def render_figure(draw, tables, name, fmt='png', dpi=DPI):
+    """
+    Draws the figure, saves it as '<name>.<fmt>' and closes it.
+    Returns the path of the file and the seconds it took.
+
+    @param draw   | function that draws the figure from the tables
+                    and returns it.
+    @param tables | tuple of the arguments of draw.
+    @param name   | path of the file without the extension.
+    @param fmt    | 'png' or 'svg'.
+    @param dpi    | resolution of the file.
+    """
+    import matplotlib.pyplot as plt
+
+    start = time.perf_counter()
+    fig = draw(*tables)
+    try:
+        path = name + '.' + fmt
+        fig.savefig(path, format=fmt, dpi=dpi)
+    finally:
+        plt.close(fig)
+    return path, time.perf_counter() - start
+
+
+def render_all(jobs, fmt='png', dpi=DPI, workers=None):
+    """
+    Renders the figures of the jobs in parallel and returns the
+    paths of the files, in the order of the jobs.
+
+    @param jobs    | list of (draw, tables, name) tuples, see
+                     render_figure.
+    @param fmt     | 'png' or 'svg'.
+    @param dpi     | resolution of the files.
+    @param workers | number of worker processes, defaults to one
+                     per job up to the number of CPUs.
+    """
+    if fmt not in FORMATS:
+        raise ValueError('Unknown figure format: ' + str(fmt))
+    if len(jobs) == 0:
+        return []
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    with instrument.measure('render.render_all', len(jobs)) as record:
+        with ProcessPoolExecutor(workers, initializer=init_worker) as pool:
+            futures = [pool.submit(render_figure, draw, tables, name, fmt,
+                                   dpi) for draw, tables, name in jobs]
+            results = [future.result() for future in futures]
+        record['rows_out'] = len(results)
+    for path, seconds in results:
+        print('Rendered %s in %.2fs' % (path, seconds))
+    return [path for path, seconds in results]
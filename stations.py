@@ -0,0 +1,161 @@
+"""
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+Keeps the table of Citi Bike stations (id, name, coordinates, first
+and last seen, former names), built incrementally while the trips
+are ingested. The cleaned trips then only store the station ids,
+and the other classes look the names and coordinates up here.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+STATION_STORE = sys.path[0] + '/stations.parquet'
+
+# Station columns of the trips that are replaced by the station ids
+DETAIL_COLUMNS = ['startstationname', 'startstationlatitude',
+                  'startstationlongitude', 'endstationname',
+                  'endstationlatitude', 'endstationlongitude']
+
+
+def observe_stations(trips):
+    """
+    Returns the station names seen in the trips, one row per
+    station id and name, with its latest coordinates and the first
+    and last start time it was seen at.
+
+    @param trips | the raw trip dataframe.
+    """
+    frames = []
+    for side in ['start', 'end']:
+        columns = {side + 'stationid': 'stationid',
+                   side + 'stationname': 'name',
+                   side + 'stationlatitude': 'latitude',
+                   side + 'stationlongitude': 'longitude'}
+        df = trips[list(columns) + ['starttime']].rename(columns=columns)
+        df = df.dropna().groupby(['stationid', 'name'], observed=True).agg(
+            latitude=('latitude', 'last'), longitude=('longitude', 'last'),
+            first_seen=('starttime', 'min'), last_seen=('starttime', 'max'))
+        frames.append(df.reset_index())
+    return merge_history(*frames)
+
+
+def merge_history(*histories):
+    """
+    Returns the station name histories merged into one, keeping the
+    earliest first seen, the latest last seen and the coordinates of
+    the latest observation of every station id and name.
+
+    @param histories | station name histories to merge.
+    """
+    df = pd.concat(histories, ignore_index=True)
+    df['stationid'] = df['stationid'].astype('int16')
+    df['name'] = df['name'].astype(str)
+    df = df.sort_values('last_seen')
+    df = df.groupby(['stationid', 'name']).agg(
+        latitude=('latitude', 'last'), longitude=('longitude', 'last'),
+        first_seen=('first_seen', 'min'), last_seen=('last_seen', 'max'))
+    return df.reset_index()
+
+
+def build_table(history):
+    """
+    Returns the station table from the station name history,
+    indexed by station id. The name and coordinates of a station are
+    the ones it was seen with last, and its other names are kept in
+    order in former_names.
+
+    @param history | the station name history.
+    """
+    history = history.sort_values(['stationid', 'last_seen'])
+    table = history.groupby('stationid').agg(
+        name=('name', 'last'), latitude=('latitude', 'last'),
+        longitude=('longitude', 'last'), first_seen=('first_seen', 'min'),
+        last_seen=('last_seen', 'max'))
+    former = history.sort_values('first_seen').groupby('stationid')['name']\
+        .agg(list)
+    table['former_names'] = [
+        [name for name in names if name != current]
+        for names, current in zip(former.loc[table.index], table['name'])]
+    table['latitude'] = table['latitude'].astype('float32')
+    table['longitude'] = table['longitude'].astype('float32')
+    return table
+
+
+def update_station_store(trips, path=None):
+    """
+    Adds the stations of the trips to the station store and returns
+    the updated station table.
+
+    @param trips | the raw trip dataframe.
+    @param path  | path of the station store, defaults to
+                   STATION_STORE.
+    """
+    path = path or STATION_STORE
+    history = observe_stations(trips)
+    if os.path.exists(path):
+        history = merge_history(pd.read_parquet(path), history)
+    history.to_parquet(path, index=False)
+    return build_table(history)
+
+
+def read_stations(path=None):
+    """
+    Returns the station table of the station store, indexed by
+    station id.
+
+    @param path | path of the station store, defaults to
+                  STATION_STORE.
+    """
+    path = path or STATION_STORE
+    return build_table(pd.read_parquet(path))
+
+
+def drop_details(trips):
+    """
+    Returns the trips without the station names and coordinates,
+    which are kept in the station table instead.
+
+    @param trips | the trip dataframe.
+    """
+    return trips.drop(columns=DETAIL_COLUMNS, errors='ignore')
+
+
+def station_names(ids, table):
+    """
+    Returns the current names of the station ids as a categorical
+    series with the same index.
+
+    @param ids   | series of station ids.
+    @param table | the station table.
+    """
+    categories = pd.Index(table['name'].unique())
+    codes = categories.get_indexer(table['name'])
+    positions = table.index.get_indexer(ids)
+    if (positions < 0).any():
+        raise KeyError('Unknown station ids: ' +
+                       str(sorted(set(ids[positions < 0]))[:10]))
+    return pd.Series(pd.Categorical.from_codes(
+        codes[positions], categories), index=ids.index, name='stationname')
+
+
+def station_coordinates(ids, table):
+    """
+    Returns the latitude and longitude of the station ids as a
+    dataframe with the same index.
+
+    @param ids   | series or array of station ids.
+    @param table | the station table.
+    """
+    positions = table.index.get_indexer(np.asarray(ids))
+    if (positions < 0).any():
+        raise KeyError('Unknown station ids')
+    return pd.DataFrame(
+        {'latitude': table['latitude'].to_numpy()[positions],
+         'longitude': table['longitude'].to_numpy()[positions]},
+        index=getattr(ids, 'index', None))
@@ -0,0 +1,219 @@
+"""
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+Runs a hyperparameter sweep of the MLPClassifier across a pool of
+worker processes. Every worker memory-maps the cached train/test
+split of the dataset class, so the training data is shared through
+the page cache instead of being copied into each worker. The models
+are trained one epoch at a time on the train set less a validation
+slice, a configuration scoring far below the best one seen so far on
+the validation slice is abandoned early, and the test set is scored
+only once for the report. Every result is appended to a csv table as
+soon as it is known, so that a sweep that was interrupted resumes
+with the configurations left.
+"""
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.neural_network import MLPClassifier
+from threadpoolctl import threadpool_limits
+
+import dataset
+
+RESULTS_PATH = sys.path[0] + '/sweep_results.csv'
+RESULT_COLUMNS = ['split', 'learning_rate', 'size', 'train_score',
+                  'validation_score', 'test_score', 'iterations',
+                  'fit_seconds', 'status']
+# A configuration is abandoned when, after at least MIN_ITER epochs,
+# its validation score is below ABANDON_RATIO times the best score
+# so far. The validation slice is the last VALIDATION_FRACTION of the
+# train set, which the split has already shuffled.
+MIN_ITER = 3
+ABANDON_RATIO = 0.5
+VALIDATION_FRACTION = 0.1
+
+# The split and best score of a worker process
+WORKER = {}
+
+
+def init_worker(split_path, best, threads):
+    """
+    Sets up a worker process: maps the split, keeps the shared best
+    score and limits the BLAS threads to the worker's share of the
+    CPU budget.
+
+    @param split_path | the directory of the cached split.
+    @param best       | shared value of the best validation score.
+    @param threads    | number of BLAS threads of the worker.
+    """
+    split = dataset.read_split(split_path)
+    WORKER['split'] = split
+    WORKER['fit'], WORKER['validation'] = hold_out(split)
+    WORKER['best'] = best
+    threadpool_limits(threads)
+
+
+def hold_out(split):
+    """
+    Returns the features and end stations of the train set less the
+    validation slice, and of the validation slice. The rows are
+    views of the memory-mapped arrays of the split.
+
+    @param split | the split, see dataset.read_split.
+    """
+    X, y = split['X_train'], split['y_train']
+    rows = X.shape[0] - int(X.shape[0] * VALIDATION_FRACTION)
+    return (row_slice(X, 0, rows), y[:rows]), \
+        (row_slice(X, rows, X.shape[0]), y[rows:])
+
+
+def row_slice(X, start, stop):
+    """
+    Returns the rows start to stop of the csr matrix, sharing its
+    data and indices instead of copying them.
+
+    @param X     | the csr matrix.
+    @param start | first row.
+    @param stop  | row after the last row.
+    """
+    first, last = X.indptr[start], X.indptr[stop]
+    return sparse.csr_matrix(
+        (X.data[first:last], X.indices[first:last],
+         X.indptr[start:stop + 1] - first),
+        shape=(stop - start, X.shape[1]), copy=False)
+
+
+def fit_config(config, max_iter):
+    """
+    Trains the MLPClassifier of the configuration one epoch at a
+    time and returns its result row.
+
+    @param config   | dict of 'learning_rate' and 'size'.
+    @param max_iter | number of epochs.
+    """
+    split, best = WORKER['split'], WORKER['best']
+    (X_fit, y_fit), (X_val, y_val) = WORKER['fit'], WORKER['validation']
+    classes = np.arange(len(split['classes']))
+    mlp = MLPClassifier(hidden_layer_sizes=config['size'],
+                        learning_rate_init=config['learning_rate'],
+                        random_state=dataset.SEED)
+    status = 'complete'
+    start = time.perf_counter()
+    for iteration in range(1, max_iter + 1):
+        mlp.partial_fit(X_fit, y_fit, classes=classes)
+        validation_score = mlp.score(X_val, y_val)
+        with best.get_lock():
+            best.value = max(best.value, validation_score)
+            losing = validation_score < best.value * ABANDON_RATIO
+        if losing and MIN_ITER <= iteration < max_iter:
+            status = 'abandoned'
+            break
+    fit_seconds = time.perf_counter() - start
+    return {'split': os.path.basename(split['path']),
+            'learning_rate': config['learning_rate'],
+            'size': str(config['size']),
+            'train_score': mlp.score(X_fit, y_fit),
+            'validation_score': validation_score,
+            'test_score': mlp.score(split['X_test'], split['y_test']),
+            'iterations': iteration,
+            'fit_seconds': fit_seconds, 'status': status}
+
+
+def read_results(path, split_key):
+    """
+    Returns the results of the table that belong to the split.
+
+    @param path      | path of the csv table.
+    @param split_key | name of the directory of the split.
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    results = pd.read_csv(path, dtype={'split': str, 'size': str})
+    return results.loc[results['split'] == split_key].reset_index(drop=True)
+
+
+def upgrade_results(path):
+    """
+    Rewrites a csv table of an older version with the columns of
+    RESULT_COLUMNS, leaving the missing scores empty.
+
+    @param path | path of the csv table.
+    """
+    if os.path.exists(path) and \
+            pd.read_csv(path, nrows=0).columns.tolist() != RESULT_COLUMNS:
+        results = pd.read_csv(path, dtype={'split': str, 'size': str})
+        results.reindex(columns=RESULT_COLUMNS).to_csv(path, index=False)
+
+
+def append_result(path, result):
+    """
+    Appends a result row to the csv table.
+
+    @param path   | path of the csv table.
+    @param result | the result row.
+    """
+    pd.DataFrame([result], columns=RESULT_COLUMNS).to_csv(
+        path, mode='a', index=False, header=not os.path.exists(path))
+
+
+def run_sweep(split, configs, max_iter=10, cpus=None, threads=1,
+              results_path=None):
+    """
+    Runs every configuration that has no result yet for the split,
+    and returns the results of all the configurations.
+
+    @param split        | the split, see dataset.load_split.
+    @param configs      | list of dicts of 'learning_rate' and 'size'.
+    @param max_iter     | number of epochs of every configuration.
+    @param cpus         | CPU budget of the sweep, defaults to all
+                          the CPUs.
+    @param threads      | number of BLAS threads per worker; the
+                          sweep runs cpus // threads workers.
+    @param results_path | path of the csv table, defaults to
+                          RESULTS_PATH.
+    """
+    results_path = results_path or RESULTS_PATH
+    upgrade_results(results_path)
+    split_key = os.path.basename(split['path'])
+    done = read_results(results_path, split_key)
+    finished = set(zip(done['learning_rate'], done['size']))
+    pending = [config for config in configs if (
+        config['learning_rate'], str(config['size'])) not in finished]
+    print('Sweep: %d of %d configurations left'
+          % (len(pending), len(configs)))
+
+    if len(pending) > 0:
+        # Largest networks first, so that they do not finish last
+        pending.sort(key=lambda config: -sum(config['size']))
+        best = multiprocessing.Value(
+            'd', done['validation_score'].fillna(0.0).max()
+            if len(done) > 0 else 0.0)
+        workers = min(len(pending), max(1, (cpus or os.cpu_count()
+                                            or 1) // threads))
+        with ProcessPoolExecutor(
+                workers, initializer=init_worker,
+                initargs=(split['path'], best, threads)) as pool:
+            futures = [pool.submit(fit_config, config, max_iter)
+                       for config in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                append_result(results_path, result)
+                print('Learning Rate %s, Size %s: %s after %d epochs, '
+                      'train %.4f, validation %.4f, test %.4f, %.1fs'
+                      % (result['learning_rate'], result['size'],
+                         result['status'], result['iterations'],
+                         result['train_score'], result['validation_score'],
+                         result['test_score'], result['fit_seconds']))
+
+    results = read_results(results_path, split_key)
+    return results.sort_values('validation_score', ascending=False,
+                               ignore_index=True)
@@ -0,0 +1,106 @@
+'''
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+This Program test that the trip allocation of the spatial analysis
+gives the same tables whether it is done once, per radius of the
+sweep or per time slice, on synthetic stations.
+'''
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+import benchmark
+import get_data
+import question1_final
+
+
+def make_stations(rows=2000):
+    """
+    Returns synthetic trips of bike stations around Jersey City,
+    one of them far from any transit station, and the transit
+    stations of two types.
+    """
+    trips = benchmark.generate_trips(rows, station_count=20,
+                                     years=(2016, 2018))
+    df_trip = get_data.add_derived_columns(
+        trips.dropna(subset=['birthyear'])).reset_index(drop=True)
+    far = df_trip['startstationid'] == df_trip['startstationid'].max()
+    df_trip.loc[far, 'startstationlatitude'] += 0.05
+
+    rng = np.random.default_rng(1)
+    transit = gpd.GeoDataFrame(
+        {'station_name': ['Rail %d' % i for i in range(5)] +
+         ['PATH 0', 'PATH 1'],
+         'public_transit_type': ['Light Rail'] * 5 + ['PATH'] * 2},
+        geometry=gpd.points_from_xy(
+            -74.05 + rng.uniform(-0.01, 0.01, 7),
+            40.72 + rng.uniform(-0.01, 0.01, 7)), crs='EPSG:4326')
+    return df_trip, transit
+
+
+def by_station(table):
+    """
+    Returns the allocated trips and trip duration of the table
+    indexed and sorted by transit station name.
+    """
+    return table.set_index('station_name')[
+        ['trip_allocate', 'tripduration_allocate']].astype(
+            'float64').sort_index()
+
+
+def test_allocation_paths():
+    """
+    Tests distribute_trips against the merge/groupby it replaced,
+    and the radius sweep and the time slices against it.
+    """
+    print('Testing allocation paths')
+    df_trip, transit = make_stations()
+    bike_stations = question1_final.get_bike_stations(df_trip)
+    bike_transit = question1_final.bike_transit_pairs(
+        bike_stations, question1_final.filter_transit(transit))
+
+    # Share of the trips of each bike station by distance
+    ratio = bike_transit['distance'] / bike_transit.groupby('index')[
+        'distance'].transform('sum')
+    expected = bike_transit[['trip count', 'tripduration']].mul(
+        ratio, axis=0).groupby(bike_transit['station_name']).sum()
+    expected.columns = ['trip_allocate', 'tripduration_allocate']
+    distributed = question1_final.distribute_trips(bike_transit)
+    pd.testing.assert_frame_equal(by_station(distributed), expected,
+                                  check_names=False)
+
+    conclusion = by_station(question1_final.conclude_data(
+        distributed, question1_final.bike_outside_transit(
+            bike_stations, question1_final.filter_bike_stations(
+                bike_stations, bike_transit))))
+    assert conclusion.loc['Not within any station', 'trip_allocate'] > 0
+    assert np.isclose(conclusion['trip_allocate'].sum(), len(df_trip))
+    assert np.isclose(conclusion['tripduration_allocate'].sum(),
+                      df_trip['tripduration'].sum())
+
+    sweep = question1_final.radius_sweep(
+        bike_stations, transit, radii=[400, question1_final.RADIUS],
+        transit_types=['Light Rail'])
+    pd.testing.assert_frame_equal(
+        by_station(sweep.loc[sweep['radius'] == question1_final.RADIUS]),
+        conclusion)
+
+    sliced = question1_final.sliced_allocation(df_trip, bike_transit,
+                                               ['year'])
+    pd.testing.assert_frame_equal(
+        by_station(sliced.groupby('station_name', as_index=False)[
+            ['trip_allocate', 'tripduration_allocate']].sum()), conclusion)
+    assert np.allclose(sliced.groupby('year')['% trip'].sum(), 1)
+
+    print('Test allocation paths: Success')
+
+
+def main():
+    test_allocation_paths()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+'''
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+This Program test the code of the data download part against a
+local stand-in for the Citi Bike S3 bucket.
+'''
+import io
+import os
+import re
+import hashlib
+import tempfile
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+import benchmark
+import cube
+import get_data
+import stations
+import trip_store
+
+
+CSV = ('Trip Duration,Start Time,Start Station Name\n' +
+       '362,2015-09-01 00:02:17,Exchange Place\n' * 200)
+
+
+def make_fixture_zip(month):
+    """
+    Returns the bytes of a monthly zip file with one small csv.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as z:
+        z.writestr('JC-' + month + '-citibike-tripdata.csv', CSV)
+    return buffer.getvalue()
+
+
+def make_trips_zip(month, rows, seed=1):
+    """
+    Returns the bytes of a monthly zip file of random trips between
+    three Jersey City stations and a few New York stations.
+    """
+    trips = benchmark.generate_trips(rows, station_count=3, seed=seed,
+                                     month=month)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as z:
+        z.writestr('JC-' + month + '-citibike-tripdata.csv',
+                   trips.to_csv(index=False))
+    return buffer.getvalue()
+
+
+def start_server(files):
+    """
+    Starts a local http server serving the given dict of
+    path -> bytes, with support for range and HEAD requests and
+    an ETag per file like S3. Returns the server and its base url.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            body = files.get(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag(body))
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+
+        def do_GET(self):
+            body = files.get(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            tag = etag(body)
+            match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+            if match:
+                start = int(match.group(1))
+                if start >= len(body):
+                    self.send_error(416)
+                    return
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes %d-%d/%d'
+                                 % (start, len(body) - 1, len(body)))
+                body = body[start:]
+            else:
+                self.send_response(200)
+            self.send_header('ETag', tag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    def etag(body):
+        return '"' + hashlib.md5(body).hexdigest() + '"'
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d' % server.server_port
+
+
+def test_download_months():
+    """
+    Tests concurrent download, manifest skipping and resuming
+    of a partial file.
+    """
+    print('Testing download_months')
+    months = ['201509', '201510', '201511']
+    files = {'/JC-' + m + '-citibike-tripdata.csv.zip': make_fixture_zip(m)
+             for m in months}
+    server, base_url = start_server(files)
+    urls = [base_url + path for path in sorted(files)]
+    try:
+        with tempfile.TemporaryDirectory() as zip_path:
+            # Leave half of the last month behind as a partial download
+            last = sorted(files)[-1]
+            with open(zip_path + last + '.part', 'wb') as f:
+                f.write(files[last][:len(files[last]) // 2])
+
+            report = get_data.download_months(urls, zip_path, workers=2)
+            assert [m['skipped'] for m in report] == [False] * 3
+            assert report[-1]['bytes'] == len(files[last]) - \
+                len(files[last]) // 2
+            for path, body in files.items():
+                with open(zip_path + path, 'rb') as f:
+                    assert f.read() == body
+            assert all(m['bytes_per_sec'] > 0 for m in report)
+
+            report = get_data.download_months(urls, zip_path, workers=2)
+            assert [m['skipped'] for m in report] == [True] * 3
+
+            # A corrupted month fails its checksum and is fetched again
+            with open(zip_path + sorted(files)[0], 'wb') as f:
+                f.write(b'corrupt')
+            report = get_data.download_months(urls, zip_path, workers=2)
+            assert [m['skipped'] for m in report] == [False, True, True]
+
+            csv_path = os.path.join(zip_path, 'csv')
+            get_data.extract_files(urls, zip_path, csv_path)
+            assert len(os.listdir(csv_path)) == 3
+
+            # Verified months are still skipped when the server is down
+            server.shutdown()
+            server.server_close()
+            report = get_data.download_months(urls, zip_path, workers=2)
+            assert [m['skipped'] for m in report] == [True] * 3
+            manifest = get_data.read_manifest(zip_path)
+            assert all('etag' in entry for entry in manifest.values())
+    finally:
+        server.shutdown()
+
+    print('Test download_months: Success')
+
+
+def test_stream_zip_files():
+    """
+    Tests that the csv files are streamed out of the zip files
+    in chunks without being extracted.
+    """
+    print('Testing stream_zip_files')
+    with tempfile.TemporaryDirectory() as zip_path:
+        paths = []
+        for month in ['201509', '201510']:
+            path = os.path.join(zip_path, month + '.zip')
+            with open(path, 'wb') as f:
+                f.write(make_fixture_zip(month))
+            paths.append(path)
+
+        chunks = []
+        rows = get_data.stream_zip_files(paths, chunks.append, chunksize=150)
+        assert rows == 400
+        assert [len(chunk) for chunk in chunks] == [150, 50, 150, 50]
+        assert list(chunks[0].columns) == \
+            ['tripduration', 'starttime', 'startstationname']
+        assert sorted(os.listdir(zip_path)) == ['201509.zip', '201510.zip']
+
+    print('Test stream_zip_files: Success')
+
+
+def month_counts(store_path):
+    """
+    Returns the number of trips of every (year, month) of the store
+    and of the cube saved with it.
+    """
+    trips = trip_store.read_trips(store_path, columns=['year', 'month'])
+    trip_cube = cube.read_cube(store_path)
+    return (trips.groupby(['year', 'month']).size().to_dict(),
+            trip_cube.groupby(['year', 'month'])['count'].sum().to_dict())
+
+
+def test_refresh_months():
+    """
+    Tests that refresh only processes new months and months that
+    were published again, replacing their partitions and cube rows.
+    """
+    print('Testing refresh_months')
+    files = {'/JC-201802-citibike-tripdata.csv.zip':
+             make_trips_zip('201802', 1200),
+             '/JC-201803-citibike-tripdata.csv.zip':
+             make_trips_zip('201803', 1500)}
+    server, base_url = start_server(files)
+    urls = [base_url + path for path in sorted(files)]
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in
+                     ['zip', 'raw', 'clean', 'stations.parquet']]
+            os.makedirs(paths[0])
+
+            def refresh():
+                return get_data.refresh_months(
+                    urls, paths[0], paths[1], paths[2], paths[3])
+
+            assert refresh() == [path[1:] for path in sorted(files)]
+            trips, counts = month_counts(paths[2])
+            assert trips == counts
+            assert refresh() == []
+
+            # March is published again with other trips
+            march = sorted(files)[1]
+            files[march] = make_trips_zip('201803', 900, seed=2)
+            assert refresh() == [march[1:]]
+            raw = trip_store.read_trips(paths[1], columns=['month'])
+            assert (raw['month'] == 3).sum() == 900
+            new_trips, new_counts = month_counts(paths[2])
+            assert new_trips == new_counts
+            assert new_trips[(2018, 2)] == trips[(2018, 2)]
+            assert new_trips[(2018, 3)] < 900 < trips[(2018, 3)]
+    finally:
+        server.shutdown()
+
+    print('Test refresh_months: Success')
+
+
+def test_data_cleaning_chunked():
+    """
+    Tests that cleaning the raw store in chunks gives the trips and
+    cube of cleaning the trips at once with data_cleaning.
+    """
+    print('Testing data_cleaning_chunked')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'trips.zip')
+        with open(path, 'wb') as f:
+            f.write(make_trips_zip('201806', 5000))
+        raw, chunked, at_once = [os.path.join(directory, name) for name
+                                 in ['raw', 'chunked', 'at_once']]
+        chunks = []
+        write_raw = get_data.store_sink(raw)
+
+        def sink(chunk):
+            # A trip missing only a station name is kept by both modes
+            chunk.loc[chunk.index[:3], 'endstationname'] = None
+            chunks.append(chunk)
+            write_raw(chunk)
+
+        get_data.stream_zip_files([path], sink)
+        assert 'startstationname' not in trip_store.read_trips(raw).columns
+
+        # A tiny memory limit cleans the 5000 trips in 1000 row chunks
+        rows = get_data.data_cleaning_chunked(raw, chunked, memory_limit=0)
+        df = get_data.data_cleaning(trip_store.concat_trips(chunks), at_once)
+        assert rows == len(df)
+
+        expected, actual = [
+            trip_store.read_trips(store).sort_values(
+                ['starttime', 'bikeid'], ignore_index=True)
+            for store in [at_once, chunked]]
+        pd.testing.assert_frame_equal(actual[expected.columns], expected,
+                                      check_dtype=False,
+                                      check_categorical=False)
+        expected, actual = [
+            cube.read_cube(store).sort_values(cube.CUBE_KEYS,
+                                              ignore_index=True)
+            for store in [at_once, chunked]]
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False,
+                                      check_categorical=False)
+
+    print('Test data_cleaning_chunked: Success')
+
+
+def test_load_trips_csv():
+    """
+    Tests that loading the trips from the cleaned csv file when
+    there is no store also builds the station table.
+    """
+    print('Testing load_trips from csv')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'trips.zip')
+        with open(path, 'wb') as f:
+            f.write(make_trips_zip('201806', 1000))
+        chunks = []
+        get_data.stream_zip_files([path], chunks.append)
+        df = get_data.data_cleaning(trip_store.concat_trips(chunks),
+                                    os.path.join(directory, 'clean'))
+        csv_file = os.path.join(directory, 'filtered_bike_data.csv')
+        df.to_csv(csv_file, index=False)
+
+        station_path = os.path.join(directory, 'stations.parquet')
+        trips = trip_store.load_trips(
+            ['startstationid', 'tripduration'],
+            store_path=os.path.join(directory, 'missing'),
+            csv_file=csv_file, station_path=station_path)
+        assert list(trips.columns) == ['startstationid', 'tripduration']
+        assert len(trips) == len(df)
+        table = stations.read_stations(station_path)
+        assert set(trips['startstationid']) <= set(table.index)
+        names = stations.station_names(df['endstationid'], table)
+        assert (np.asarray(names) == df['endstationname'].astype(str)).all()
+
+    print('Test load_trips from csv: Success')
+
+
+def main():
+    test_download_months()
+    test_stream_zip_files()
+    test_refresh_months()
+    test_data_cleaning_chunked()
+    test_load_trips_csv()
+
+
+if __name__ == '__main__':
+    main()
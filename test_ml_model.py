@@ -0,0 +1,57 @@
+'''
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+This Program test that the decision tree accuracy curve computed
+from one fully grown tree matches trees grown to each max depth.
+'''
+import numpy as np
+from sklearn.metrics import accuracy_score
+from sklearn.tree import DecisionTreeClassifier
+
+import dataset
+import ml_model
+
+
+def test_depth_accuracy():
+    """
+    Tests depth_accuracy against trees fitted with a max depth.
+    """
+    print('Testing depth_accuracy')
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(3000, 5))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(0, 0.5, 3000) > 0) + \
+        2 * (X[:, 3] > 0.5)
+    X_train, X_test, y_train, y_test = X[:2000], X[2000:], y[:2000], y[2000:]
+
+    model = DecisionTreeClassifier(random_state=dataset.SEED)
+    model.fit(X_train, y_train)
+    train_acc = ml_model.depth_accuracy(model, X_train, y_train,
+                                        batch_rows=700)
+    test_acc = ml_model.depth_accuracy(model, X_test, y_test)
+    assert len(train_acc) == model.get_depth()
+    assert train_acc[-1] == 1.0
+
+    # Deeper trees can pick other splits among equally good ones,
+    # as the random state is drawn at more nodes of the full tree
+    for depth in [1, 3, 5, 8, 12]:
+        grown = DecisionTreeClassifier(max_depth=depth,
+                                       random_state=dataset.SEED)
+        grown.fit(X_train, y_train)
+        tolerance = 1e-9 if depth <= 5 else 0.01
+        assert abs(train_acc[depth - 1] - accuracy_score(
+            y_train, grown.predict(X_train))) <= tolerance
+        assert abs(test_acc[depth - 1] - accuracy_score(
+            y_test, grown.predict(X_test))) <= tolerance
+
+    print('Test depth_accuracy: Success')
+
+
+def main():
+    test_depth_accuracy()
+
+
+if __name__ == '__main__':
+    main()
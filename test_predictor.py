@@ -0,0 +1,106 @@
+'''
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+This Program test the end station predictor: training and saving
+versions of the model, top-k scoring and the http endpoint.
+'''
+import json
+import tempfile
+import threading
+from urllib.error import HTTPError
+
+import numpy as np
+import pandas as pd
+
+import benchmark
+import predictor
+
+STATIONS = ['Grove St PATH', 'Exchange Place', 'Newport PATH']
+
+
+def make_trips(rows=3000):
+    """
+    Returns filtered trip data where the end station follows from
+    the start station, with the raw columns of the trips to score.
+    """
+    trips = benchmark.generate_trips(rows, station_count=3, month='201806')
+    trips = trips.dropna(subset=['birthyear']).reset_index(drop=True)[
+        ['startstationid', 'starttime', 'usertype', 'gender', 'birthyear']]
+    filtered = pd.DataFrame(predictor.trip_features(trips))
+    filtered['endstationname'] = np.asarray(STATIONS)[
+        trips['startstationid'] - 3183]
+    return filtered, trips
+
+
+def train_model(filtered, directory):
+    """
+    Returns the predictor trained with its split cached in the
+    directory.
+    """
+    return predictor.train(filtered, max_depth=5,
+                           cache_dir=directory + '/split_cache')
+
+
+def test_train_save_score():
+    """
+    Tests that saved versions load back and score the trips.
+    """
+    filtered, trips = make_trips()
+    with tempfile.TemporaryDirectory() as directory:
+        model = train_model(filtered, directory)
+        assert predictor.save(model, directory) == 1
+        assert predictor.save(model, directory) == 2
+        loaded = predictor.load(model_dir=directory)
+        assert loaded['meta']['version'] == 2
+        assert loaded['meta']['test_accuracy'] == 1.0
+
+        scores = predictor.score(loaded, trips.head(10), k=2)
+        assert len(scores) == 20
+        best = scores.loc[scores['rank'] == 1, 'endstationname']
+        expected = np.asarray(STATIONS)[trips['startstationid'][:10] - 3183]
+        assert (best.to_numpy() == expected).all()
+        assert (scores.groupby('trip')['probability'].sum() <= 1 + 1e-9).all()
+
+
+def test_http_endpoint():
+    """
+    Tests that the http endpoint answers like the scoring API, for
+    trips sent as columns or as records, and rejects a k below 1.
+    """
+    filtered, trips = make_trips()
+    with tempfile.TemporaryDirectory() as directory:
+        model = train_model(filtered, directory)
+    server = predictor.make_server(model, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d' % server.server_address[1]
+    batch = trips.head(3).astype({'starttime': str})
+    try:
+        answers = [predictor.post_trips(url, batch.to_dict('list'), k=2),
+                   predictor.post_trips(url, batch.to_dict('records'), k=2)]
+        errors = []
+        for k in [0, -1]:
+            try:
+                predictor.post_trips(url, batch.to_dict('list'), k=k)
+            except HTTPError as error:
+                errors.append((error.code, json.load(error)['error']))
+    finally:
+        server.shutdown()
+        server.server_close()
+    names, _ = predictor.top_k(model, trips.head(3), k=2)
+    for answer in answers:
+        assert [[p['endstationname'] for p in row]
+                for row in answer['predictions']] == names.tolist()
+    assert [code for code, _ in errors] == [400, 400]
+    assert all('k must be at least 1' in message for _, message in errors)
+
+
+def main():
+    test_train_save_score()
+    test_http_endpoint()
+
+
+if __name__ == '__main__':
+    main()
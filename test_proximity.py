@@ -0,0 +1,86 @@
+'''
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+This Program test the queries of the spatial index against the
+full distance matrix of the bike and transit stations.
+'''
+import os
+import tempfile
+
+import numpy as np
+
+import proximity
+import question1_final
+import test_allocation
+
+
+def test_spatial_index():
+    """
+    Tests the radius, nearest, per type and bulk queries of the
+    spatial index, and that it loads back from disk.
+    """
+    print('Testing spatial index')
+    df_trip, transit = test_allocation.make_stations()
+    bike_stations = question1_final.get_bike_stations(df_trip)
+    index = proximity.build_index(bike_stations, transit)
+    distances = proximity.distance_matrix(proximity.project(bike_stations),
+                                          proximity.project(transit))
+    names = transit['station_name'].to_numpy()
+    types = transit['public_transit_type'].to_numpy()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'index.pkl')
+        proximity.save_index(index, path)
+        loaded = proximity.load_index(path)
+
+    for row, bike_id in enumerate(bike_stations.index):
+        order = np.argsort(distances[row], kind='stable')
+        within = order[distances[row][order] <= question1_final.RADIUS]
+        result = proximity.transit_within(loaded, bike_id,
+                                          question1_final.RADIUS)
+        assert result['station_name'].tolist() == names[within].tolist()
+        assert np.allclose(result['distance'], distances[row][within])
+
+        rail = within[types[within] == 'Light Rail']
+        result = proximity.transit_within(
+            loaded, bike_id, question1_final.RADIUS, 'Light Rail')
+        assert result['station_name'].tolist() == names[rail].tolist()
+
+        result = proximity.nearest_transit(loaded, bike_id, k=3)
+        assert result['station_name'].tolist() == names[order[:3]].tolist()
+        assert np.allclose(result['distance'], distances[row][order[:3]])
+        result = proximity.nearest_transit(loaded, bike_id, k=10,
+                                           transit_type='PATH')
+        assert result['station_name'].tolist() == \
+            names[order[types[order] == 'PATH']].tolist()
+
+    # Every trip start as a point of the bulk query
+    lon = df_trip['startstationlongitude'].to_numpy()
+    lat = df_trip['startstationlatitude'].to_numpy()
+    pairs = proximity.points_within(loaded, lon, lat, question1_final.RADIUS)
+    station_rows = bike_stations.index.get_indexer(df_trip['startstationid'])
+    expected = (distances[station_rows] <= question1_final.RADIUS).sum()
+    assert len(pairs) == expected
+    columns = [names.tolist().index(name) for name in pairs['station_name']]
+    assert np.allclose(pairs['distance'],
+                       distances[station_rows[pairs['point']], columns])
+
+    try:
+        proximity.nearest_transit(index, bike_stations.index[0], k=0)
+    except ValueError as error:
+        assert 'k must be at least 1' in str(error)
+    else:
+        assert False, 'k=0 was accepted'
+
+    print('Test spatial index: Success')
+
+
+def main():
+    test_spatial_index()
+
+
+if __name__ == '__main__':
+    main()
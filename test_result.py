@@ -9,7 +9,7 @@ whether it runs successfully and correctly.
 '''
 
 from assert_equal import assert_equals
-import question1
+import question1_final
 
 import pandas as pd
 import geopandas as gpd
@@ -37,7 +37,7 @@ def test_spatial_analysis():
     # This is just the base map of Jersey City
     doc3 = gpd.read_file('jersey-city-parcels.geojson')
 
-    result = question1.spatial_analysis(doc1, doc2, doc3)
+    result = question1_final.spatial_analysis(doc1, doc2, doc3)
     assert_equals(float(len(doc1)), result['trip_allocate'].sum())
     assert_equals(1.0, result['% trip'].sum())
     assert_equals(1.0, result['% tripduration'].sum())
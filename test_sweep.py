@@ -0,0 +1,56 @@
+'''
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+This Program test that the hyperparameter sweep holds a validation
+slice out of the train set and resumes from its csv table.
+'''
+import os
+import tempfile
+
+import dataset
+import sweep
+import test_predictor
+
+
+def test_sweep():
+    """
+    Tests the validation slice and that a sweep run again only fits
+    the configurations left.
+    """
+    print('Testing sweep')
+    filtered, _ = test_predictor.make_trips()
+    with tempfile.TemporaryDirectory() as directory:
+        split = dataset.load_split(filtered,
+                                   cache_dir=directory + '/split_cache')
+        X_train = split['X_train']
+        (X_fit, y_fit), (X_val, y_val) = sweep.hold_out(split)
+        rows = X_fit.shape[0]
+        assert X_val.shape[0] == int(X_train.shape[0] *
+                                     sweep.VALIDATION_FRACTION)
+        assert (X_fit != X_train[:rows]).nnz == 0
+        assert (X_val != X_train[rows:]).nnz == 0
+        assert (y_val == split['y_train'][rows:]).all()
+
+        path = os.path.join(directory, 'results.csv')
+        configs = [{'learning_rate': 0.01, 'size': (10,)}]
+        sweep.run_sweep(split, configs, max_iter=2, cpus=1,
+                        results_path=path)
+        configs.append({'learning_rate': 0.5, 'size': (10,)})
+        results = sweep.run_sweep(split, configs, max_iter=2, cpus=1,
+                                  results_path=path)
+        assert len(results) == 2
+        assert results['validation_score'].is_monotonic_decreasing
+        assert results['iterations'].eq(2).all()
+
+    print('Test sweep: Success')
+
+
+def main():
+    test_sweep()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+"""
+Section AC
+Topic: Final Project
+Group Members: Kairui Huang, Runbo Wang, Danhiel Vu
+Date: 03/13/2020
+
+Stores the Citi Bike trip data as Parquet files partitioned by
+year and month, so that the other classes can read only the
+columns and months they need instead of re-parsing whole csv files.
+"""
+import os
+import sys
+import shutil
+import uuid
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+import stations
+
+RAW_STORE = sys.path[0] + '/bike_data.parquet'
+CLEAN_STORE = sys.path[0] + '/filtered_bike_data.parquet'
+CLEAN_CSV = sys.path[0] + '/filtered_bike_data.csv'
+
+PARTITIONING = ds.partitioning(
+    pa.schema([('year', pa.int16()), ('month', pa.int8())]), flavor='hive')
+
+# Compact column types of the raw and cleaned trip data.
+# Station ids (3000s) and ages fit in int16, gender/hour/month in
+# int8, and repeated labels are stored once as categories.
+TRIP_DTYPES = {
+    'tripduration': 'int32',
+    'starttime': 'datetime64[ns]',
+    'stoptime': 'datetime64[ns]',
+    'startstationid': 'int16',
+    'startstationname': 'category',
+    'startstationlatitude': 'float32',
+    'startstationlongitude': 'float32',
+    'endstationid': 'int16',
+    'endstationname': 'category',
+    'endstationlatitude': 'float32',
+    'endstationlongitude': 'float32',
+    'bikeid': 'int32',
+    'usertype': 'category',
+    # birth year is missing for some trips before cleaning
+    'birthyear': 'Int16',
+    'gender': 'int8',
+    'Hour': 'int8',
+    'Period': 'category',
+    'Peak': 'category',
+    'Season': 'category',
+    'month': 'int8',
+    'year': 'int16',
+    'age': 'int16',
+}
+
+
+# Columns of the trips the station table is built from
+STATION_COLUMNS = ['starttime', 'startstationid', 'endstationid'] + \
+    stations.DETAIL_COLUMNS
+
+
+# Start/stop time formats used by the different Citi Bike files,
+# e.g. '2015-09-01 00:00:02', '2018-01-01 02:23:43.6010' and
+# '9/1/2016 00:00:02'
+TIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f',
+                '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M']
+
+
+def parse_starttime(times):
+    """
+    Returns the series of time strings parsed as datetime64.
+    Every format of TIME_FORMATS is tried explicitly, only on the
+    values that no earlier format could parse, which is much faster
+    than letting pandas guess the format of every value.
+
+    @param times | series of start or stop times.
+    """
+    if pd.api.types.is_datetime64_any_dtype(times):
+        return times
+    parsed = pd.Series(pd.NaT, index=times.index, dtype='datetime64[ns]')
+    left = times.notna()
+    for time_format in TIME_FORMATS:
+        if not left.any():
+            break
+        parsed[left] = pd.to_datetime(times[left], format=time_format,
+                                      errors='coerce')
+        left = left & parsed.isna()
+    if left.any():
+        raise ValueError('Unknown time format: ' + str(times[left].iloc[0]))
+    return parsed
+
+
+def apply_schema(df):
+    """
+    Converts the columns of the dataframe to the trip data types
+    and returns it. Columns that are not part of the schema are
+    left as they are.
+
+    @param df | the trip dataframe.
+    """
+    dtypes = {column: dtype for column, dtype in TRIP_DTYPES.items()
+              if column in df.columns and df[column].dtype != dtype}
+    for column, dtype in dtypes.items():
+        if dtype.startswith('datetime64'):
+            df[column] = parse_starttime(df[column])
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def compact_trips(df, name='trips'):
+    """
+    Applies the trip data types to the dataframe, prints how much
+    memory it used before and after, and returns it.
+
+    @param df   | the trip dataframe.
+    @param name | the name of the data in the report.
+    """
+    before = df.memory_usage(deep=True).sum()
+    df = apply_schema(df)
+    after = df.memory_usage(deep=True).sum()
+    print('Memory of %s: %.1f MB -> %.1f MB (%.1fx smaller)'
+          % (name, before / 2 ** 20, after / 2 ** 20,
+             before / max(after, 1)))
+    return df
+
+
+def concat_trips(frames):
+    """
+    Concatenates trip dataframes and returns the result. The
+    categories of categorical columns are unified first, so that
+    they stay categorical instead of falling back to strings.
+
+    @param frames | list of trip dataframes.
+    """
+    frames = list(frames)
+    if len(frames) == 0:
+        return pd.DataFrame()
+    for column in frames[0].columns:
+        if not all(column in df.columns and
+                   isinstance(df[column].dtype, pd.CategoricalDtype)
+                   for df in frames):
+            continue
+        categories = union_categoricals(
+            [df[column] for df in frames]).categories
+        for df in frames:
+            df[column] = df[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_trips(df, store_path, overwrite=False, replace=False):
+    """
+    Writes the trip dataframe to the store, partitioned by the
+    year and month of its start time. New files are added next
+    to the existing ones unless overwrite is True.
+
+    @param df         | the trip dataframe.
+    @param store_path | the directory of the store.
+    @param overwrite  | delete the existing store first.
+    @param replace    | delete the existing files of the months
+                        being written first.
+    """
+    if overwrite and os.path.exists(store_path):
+        shutil.rmtree(store_path)
+
+    df = apply_schema(df.copy())
+    if 'year' not in df.columns:
+        df['year'] = df['starttime'].dt.year.astype('int16')
+    if 'month' not in df.columns:
+        df['month'] = df['starttime'].dt.month.astype('int8')
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    ds.write_dataset(
+        table, store_path, format='parquet', partitioning=PARTITIONING,
+        basename_template='part-' + uuid.uuid4().hex + '-{i}.parquet',
+        existing_data_behavior='delete_matching' if replace
+        else 'overwrite_or_ignore')
+
+
+def read_trips(store_path, columns=None, years=None, months=None):
+    """
+    Returns the trips of the store as a dataframe. Only the given
+    columns are read, and only the partitions of the given years
+    and months are opened.
+
+    @param store_path | the directory of the store.
+    @param columns    | list of columns to read, defaults to all.
+    @param years      | list of years to read, defaults to all.
+    @param months     | list of months to read, defaults to all.
+    """
+    dataset = ds.dataset(store_path, format='parquet',
+                         partitioning=PARTITIONING)
+    row_filter = None
+    if years is not None:
+        row_filter = ds.field('year').isin(list(years))
+    if months is not None:
+        month_filter = ds.field('month').isin(list(months))
+        row_filter = month_filter if row_filter is None \
+            else row_filter & month_filter
+    table = dataset.to_table(columns=columns, filter=row_filter)
+    return table.to_pandas()
+
+
+def iter_trips(store_path, batch_rows, columns=None):
+    """
+    Yields the trips of the store as dataframes of at most
+    batch_rows rows, so that the store never has to fit in memory.
+
+    @param store_path | the directory of the store.
+    @param batch_rows | maximum number of rows per dataframe.
+    @param columns    | list of columns to read, defaults to all.
+    """
+    dataset = ds.dataset(store_path, format='parquet',
+                         partitioning=PARTITIONING)
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_rows):
+        if batch.num_rows > 0:
+            yield batch.to_pandas()
+
+
+def load_trips(columns=None, years=None, months=None,
+               store_path=CLEAN_STORE, csv_file=CLEAN_CSV,
+               station_path=None):
+    """
+    Returns the cleaned trips, read from the store when it exists
+    and from the csv file otherwise. The csv file still has the
+    station names and coordinates, so when there is no station
+    table yet it is built from the csv file too, for the callers
+    that look the stations up by id.
+
+    @param columns      | list of columns to read, defaults to all.
+    @param years        | list of years to read, defaults to all.
+    @param months       | list of months to read, defaults to all.
+    @param store_path   | the directory of the store.
+    @param csv_file     | the csv file used when there is no store.
+    @param station_path | path of the station store, defaults to
+                          stations.STATION_STORE.
+    """
+    if os.path.exists(store_path):
+        return read_trips(store_path, columns, years, months)
+
+    station_path = station_path or stations.STATION_STORE
+    if os.path.exists(station_path):
+        df = pd.read_csv(csv_file, usecols=columns)
+    else:
+        wanted = set(columns or []) | set(STATION_COLUMNS)
+        df = apply_schema(pd.read_csv(
+            csv_file, usecols=None if columns is None
+            else lambda column: column in wanted))
+        if set(STATION_COLUMNS) <= set(df.columns):
+            stations.update_station_store(df, station_path)
+        if columns is not None:
+            df = df[columns]
+    if years is not None:
+        df = df.loc[df['year'].isin(years)]
+    if months is not None:
+        df = df.loc[df['month'].isin(months)]
+    return apply_schema(df)
+
+
+def convert_csv(csv_file, store_path, chunksize=1000000, keys_only=False):
+    """
+    Converts an existing trip csv file into a store, reading it
+    in chunks of chunksize rows, and adds its stations to the station
+    table. Returns the number of rows.
+
+    @param csv_file   | the csv file to convert.
+    @param store_path | the directory of the store.
+    @param chunksize  | number of rows per chunk.
+    @param keys_only  | only store the station ids of the trips,
+                        not their names and coordinates.
+    """
+    print('Converting ' + csv_file + ': Started')
+    if os.path.exists(store_path):
+        shutil.rmtree(store_path)
+    rows = 0
+    for chunk in pd.read_csv(csv_file, chunksize=chunksize):
+        chunk = apply_schema(chunk)
+        stations.update_station_store(chunk)
+        if keys_only:
+            chunk = stations.drop_details(chunk)
+        write_trips(chunk, store_path)
+        rows += len(chunk)
+    print('Converting ' + csv_file + ': Complete')
+    return rows
+
+
+def main():
+    """
+    Converts the csv files of the pipeline that exist into stores.
+    """
+    raw_csv = sys.path[0] + '/bike_data.csv'
+    if os.path.exists(raw_csv):
+        convert_csv(raw_csv, RAW_STORE, keys_only=True)
+    if os.path.exists(CLEAN_CSV):
+        convert_csv(CLEAN_CSV, CLEAN_STORE, keys_only=True)
+
+
+if __name__ == '__main__':
+    main()